@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+# -*- encoding: utf-8 -*-
+# Copyright © 2014 Karl Ramm
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+# CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS
+# BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+'''
+Time filter evaluation, interpreting the filter tree versus running the
+compiled filter.
+
+usage: filters.py [messages]
+'''
+
+import sys
+import os
+import time
+import random
+
+sys.path[0:0] = [os.path.dirname(os.path.dirname(os.path.realpath(__file__)))]
+
+import snipe.messages
+import snipe.filters
+
+
+FILTERS = [
+    'class = "help"',
+    'class = "help" and instance = "snipe"',
+    'personal or class = "message" and not noise',
+    'class = /^help/ or instance = /lunch|dinner/ or sender = "user3"',
+    'sender = "user3" xor instance == "Snipe"',
+    'number > 500 and number <= 1500',
+    'not (class = "kcr" or class = "sipb" or class = "snipe") and body',
+    ]
+
+
+class Backend:
+    name = 'bench'
+
+
+def build(total):
+    backend = Backend()
+    now = time.time()
+    messages = []
+    for i in range(total):
+        m = snipe.messages.SnipeMessage(backend, 'message %d' % (i,), now + i)
+        m.data = {
+            'class': random.choice(['help', 'sipb', 'message', 'kcr']),
+            'instance': random.choice(['personal', 'snipe', 'Snipe', 'lunch']),
+            'sender': 'user%d' % (random.randrange(50),),
+            'number': random.randrange(2000),
+            }
+        m.personal = random.random() < .1
+        m.noise = random.random() < .2
+        messages.append(m)
+    return messages
+
+
+def clock(messages, f):
+    t0 = time.perf_counter()
+    n = len([m for m in messages if f(m)])
+    return n, (time.perf_counter() - t0) / len(messages) * 1e6
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    random.seed(0)
+    messages = build(total)
+
+    print('%-68s %8s %8s' % ('filter', 'tree', 'compiled'))
+    for text in FILTERS:
+        tree = snipe.filters.makefilter(text)
+        compiled = snipe.filters.compiled(tree)
+        clock(messages, tree) # warm the field cache
+        n1, interpreted = clock(messages, tree)
+        n2, generated = clock(messages, compiled)
+        assert n1 == n2, (text, n1, n2)
+        print('%-68s %6.2fµs %6.2fµs' % (text, interpreted, generated))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+# -*- encoding: utf-8 -*-
+# Copyright © 2014 Karl Ramm
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+# CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS
+# BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+'''
+Measure how much memory messages take once they're loaded.
+
+usage: memory.py [messages]
+'''
+
+import sys
+import os
+import json
+import random
+import time
+import tracemalloc
+
+sys.path[0:0] = [os.path.dirname(os.path.dirname(os.path.realpath(__file__)))]
+
+import snipe.messages
+import snipe.messagelist
+import snipe.roost
+import snipe.irccloud
+
+
+class FakeRooster:
+    principal = 'kcr@ATHENA.MIT.EDU'
+
+
+class FakeRoost:
+    name = 'roost'
+    realm = 'ATHENA.MIT.EDU'
+    r = FakeRooster()
+
+
+class FakeIRCCloud:
+    name = 'irccloud'
+    connections = {1: {'hostname': 'irc.example.com'}}
+    buffers = {
+        i: {'name': '#channel%d' % (i,), 'cid': 1} for i in range(10)}
+
+
+WORDS = 'the quick brown fox jumps over a lazy dog zephyr snipe roost'.split()
+
+
+def body():
+    return ' '.join(
+        random.choice(WORDS) for i in range(random.randrange(5, 40))) + '\n'
+
+
+def roost_json(i, now):
+    return json.dumps({
+        'id': '%016x' % (i,),
+        'time': (now + i) * 1000,
+        'receiveTime': (now + i) * 1000,
+        'class': random.choice(['help', 'sipb', 'message', 'kcr', 'ununclass.d']),
+        'instance': random.choice(['personal', 'snipe', 'lunch', 'question']),
+        'sender': 'user%d@ATHENA.MIT.EDU' % (random.randrange(50),),
+        'recipient': random.choice(['', '', '', 'kcr@ATHENA.MIT.EDU']),
+        'realm': 'ATHENA.MIT.EDU',
+        'auth': 1,
+        'opcode': random.choice(['', '', 'auto']),
+        'signature': 'User %d' % (random.randrange(50),),
+        'message': body(),
+        })
+
+
+def irccloud_json(i, now):
+    nick = 'nick%d' % (random.randrange(50),)
+    return json.dumps({
+        'type': 'buffer_msg',
+        'eid': (now + i) * 1000000,
+        'cid': 1,
+        'bid': random.randrange(10),
+        'chan': '#channel%d' % (random.randrange(10),),
+        'from': nick,
+        'from_name': nick,
+        'from_host': 'host.example.com',
+        'msg': body(),
+        })
+
+
+def measure(tag, n, make, keep=list):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = keep(make(i) for i in range(n))
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print('%-24s %8d messages %10.1f bytes/message' % (
+        tag, len(kept), (after - before) / n))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    now = int(time.time())
+
+    random.seed(0)
+    roost = [roost_json(i, now) for i in range(n)]
+    irccloud = [irccloud_json(i, now) for i in range(n)]
+    backend, roostbackend, ircbackend = (
+        FakeRoost(), FakeRoost(), FakeIRCCloud())
+
+    measure('raw roost json', n, lambda i: json.loads(roost[i]))
+    measure(
+        'SnipeMessage', n,
+        lambda i: snipe.messages.SnipeMessage(backend, body(), now + i))
+    measure(
+        'RoostMessage', n,
+        lambda i: snipe.roost.RoostMessage(
+            roostbackend, json.loads(roost[i])))
+    # what a roost backend actually holds on to
+    measure(
+        'RoostMessage (indexed)', n,
+        lambda i: snipe.roost.RoostMessage(
+            roostbackend, json.loads(roost[i])),
+        lambda ms: snipe.messagelist.MessageList(
+            ms, indexed=snipe.roost.Roost.indexed_fields,
+            words=True, days=True))
+    measure(
+        'IRCCloudMessage', n,
+        lambda i: snipe.irccloud.IRCCloudMessage(
+            ircbackend, json.loads(irccloud[i])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+# -*- encoding: utf-8 -*-
+# Copyright © 2014 Karl Ramm
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+# CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS
+# BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+'''
+Time importing snipe.filters in a fresh interpreter, with the shipped
+parse tables and with them hidden so ply has to build them again.
+
+usage: startup.py [runs]
+'''
+
+import sys
+import os
+import subprocess
+
+
+TOP = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# snipe.util drags in aiohttp and friends, which isn't what we're
+# measuring, so it's imported before the clock starts
+CHILD = '''
+import sys, time
+sys.path.insert(0, %r)
+if %r:
+    sys.modules['snipe._parsetab'] = None
+import snipe.util
+t0 = time.perf_counter()
+import snipe.filters
+t1 = time.perf_counter()
+snipe.filters.makefilter('class = "help" and not personal')
+t2 = time.perf_counter()
+# the part the tables are for; most of the import is the lexer
+snipe.filters.Parser()
+t3 = time.perf_counter()
+print(t1 - t0, t2 - t1, t3 - t2)
+'''
+
+
+def run(hidden):
+    out = subprocess.check_output(
+        [sys.executable, '-W', 'ignore', '-c', CHILD % (TOP, hidden)],
+        stderr=subprocess.DEVNULL)
+    return [float(x) for x in out.split()]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    print('%-24s %10s %12s %10s' % (
+        'tables', 'import', 'first parse', 'Parser()'))
+    for label, hidden in [('regenerated', True), ('shipped', False)]:
+        results = [run(hidden) for i in range(runs)]
+        print('%-24s %8.2fms %10.2fms %8.2fms' % (
+            label,
+            min(r[0] for r in results) * 1000,
+            min(r[1] for r in results) * 1000,
+            min(r[2] for r in results) * 1000,
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+# -*- encoding: utf-8 -*-
+# Copyright © 2014 Karl Ramm
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+# CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS
+# BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+'''
+Time walking the aggregated message list.
+
+usage: walk.py [total messages [backends]]
+'''
+
+import sys
+import os
+import time
+import random
+
+sys.path[0:0] = [os.path.dirname(os.path.dirname(os.path.realpath(__file__)))]
+
+import snipe.messages
+import snipe.messagelist
+import snipe.filters
+
+
+class Context:
+    def __init__(self):
+        self.context = self
+        self.conf = {}
+
+
+class BenchBackend(snipe.messages.SnipeBackend):
+    indexed_fields = ('tag',)
+
+    def __init__(self, context, name, times):
+        super().__init__(context)
+        self.name = name
+        messages = []
+        for (i, t) in enumerate(times):
+            m = snipe.messages.SnipeMessage(self, 'message %d' % (i,), t)
+            m.data['tag'] = random.randrange(100)
+            messages.append(m)
+        self.messages = snipe.messagelist.MessageList(
+            messages, indexed=self.indexed_fields, words=True)
+
+
+def build(total, nbackends):
+    context = Context()
+    now = time.time()
+    times = [[] for i in range(nbackends)]
+    for i in range(total):
+        times[random.randrange(nbackends)].append(now - total + i)
+    backends = [
+        BenchBackend(context, 'bench%d' % (i,), t)
+        for (i, t) in enumerate(times)]
+    return snipe.messages.AggregatorBackend(context, backends)
+
+
+def clock(tag, total, f):
+    t0 = time.perf_counter()
+    n = f()
+    elapsed = time.perf_counter() - t0
+    print('%-24s %8d operations %8.3fs %8.3fµs/operation' % (
+        tag, n, elapsed, elapsed / max(n, 1) * 1e6))
+
+
+def seek(aggregator, n):
+    backend = aggregator.backends[1]
+    first, last = backend.messages[0].time, backend.messages[-1].time
+    for i in range(n):
+        next(backend.walk(random.uniform(first, last), True))
+    return n
+
+
+def step(aggregator, mfilter, n):
+    # what moving to the next message does under a filter
+    backend = aggregator.backends[1]
+    first, last = backend.messages[0].time, backend.messages[-1].time
+    for i in range(n):
+        next(aggregator.walk(random.uniform(first, last), True, mfilter), None)
+    return n
+
+
+def burst(n, size=10000):
+    # a burst of messages that all arrived in the same millisecond
+    messages = []
+    for i in range(size):
+        m = snipe.messages.SnipeMessage(None, 'message %d' % (i,), 0.0)
+        m.seq = i
+        messages.append(m)
+    l = snipe.messagelist.MessageList(messages)
+    for i in range(n):
+        l.seek(random.choice(messages))
+    return n
+
+
+def backfill(aggregator, chunksize=128):
+    # rebuild the first backend's list the way a deep roost backfill would
+    messages = list(aggregator.backends[1].messages)
+    l = snipe.messagelist.MessageList()
+    for i in range(len(messages), 0, -chunksize):
+        l.prepend(messages[max(0, i - chunksize):i])
+    return len(l)
+
+
+def count(it):
+    n = 0
+    for m in it:
+        n += 1
+    return n
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    nbackends = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+
+    print('%d messages across %d backends' % (total, nbackends))
+    aggregator = build(total, nbackends)
+    clock('walk forward', total, lambda: count(aggregator.walk(None, True)))
+    clock('walk backward', total, lambda: count(aggregator.walk(None, False)))
+    clock(
+        'walk forward (batches)', total,
+        lambda: sum(len(b) for b in aggregator.walk_batches(None, True)))
+    clock('seek', 10000, lambda: seek(aggregator, 10000))
+    clock('seek (in a burst)', 10000, lambda: burst(10000))
+    # one message in a hundred; '==' can't use the posting lists
+    indexed = snipe.filters.makefilter('tag = 7')
+    scanned = snipe.filters.makefilter('tag == 7')
+    clock(
+        'sparse walk (index)', total,
+        lambda: count(aggregator.walk(None, True, indexed)) and total)
+    clock(
+        'sparse walk (scan)', total,
+        lambda: count(aggregator.walk(None, True, scanned)) and total)
+    clock(
+        'sparse walk (again)', total,
+        lambda: count(aggregator.walk(None, True, scanned)) and total)
+    python = snipe.filters.makefilter('$"m.data[\'tag\'] == 7"')
+    clock('step (index)', 1000, lambda: step(aggregator, indexed, 1000))
+    clock('step (scan)', 1000, lambda: step(aggregator, scanned, 1000))
+    clock('step (python)', 1000, lambda: step(aggregator, python, 1000))
+    # the last 1% of the messages, walking backward the way the display
+    # does; the python filter can't be clipped to the time range
+    recent = int(aggregator.backends[1].messages[-1].time - total / 100)
+    clipped = snipe.filters.makefilter('since %d' % (recent,))
+    scanned = snipe.filters.makefilter('$"m.time >= %d"' % (recent,))
+    clock(
+        'recent walk (since)', total,
+        lambda: count(aggregator.walk(None, False, clipped)) and total)
+    clock(
+        'recent walk (scan)', total,
+        lambda: count(aggregator.walk(None, False, scanned)) and total)
+    # the python filter can't use the word index
+    indexed = snipe.filters.makefilter('body = /.*age 4242$/')
+    scanned = snipe.filters.makefilter('$"m.body.endswith(\'age 4242\')"')
+    clock(
+        'text search (index)', total,
+        lambda: count(aggregator.walk(None, True, indexed)) and total)
+    clock(
+        'text search (again)', total,
+        lambda: count(aggregator.walk(None, True, indexed)) and total)
+    clock(
+        'text search (scan)', total,
+        lambda: count(aggregator.walk(None, True, scanned)) and total)
+    clock('backfill', total, lambda: backfill(aggregator))
+    clock(
+        'merge only', total,
+        lambda: count(snipe.messages.merge(
+            [b.messages for b in aggregator.backends],
+            key=lambda m: m.time)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+
+# _parsetab.py
+# This file is automatically generated. Do not edit.
+# pylint: disable=W,C,R
+_tabversion = '3.10'
+
+_lr_method = 'LALR'
+
+_lr_signature = 'leftXORORANDrightNOTAND EQ EQEQ FILTER GT GTE ID LPAREN LT LTE NE NO NOT NUMBER OR PYTHON REGEXP RPAREN SINCE STRING UNTIL XOR YESfil : expfil :exp : YESexp : NOexp : PYTHON\n        exp : SINCE NUMBER\n            | SINCE STRING\n            | UNTIL NUMBER\n            | UNTIL STRING\n        exp : FILTER IDexp : LPAREN exp RPARENexp : NOT expexp : exp AND expexp : exp OR expexp : exp XOR exp\n        val : NUMBER\n            | STRING\n            | id\n        \n        eop : EQ\n            | EQEQ\n            | NE\n        \n        rop : LT\n            | LTE\n            | GT\n            | GTE\n        \n        op  : eop\n            | rop\n        \n        id  : ID\n        \n        re  : REGEXP\n        \n        exp : val op val\n        \n        exp : val eop re\n            | re eop val\n        \n        exp : ID\n        '
+    
+_lr_action_items = {'$end':([0,1,2,3,4,5,7,8,11,16,17,21,22,23,24,25,27,39,40,41,42,43,44,45,46,],[-2,0,-1,-3,-4,-5,-16,-17,-33,-18,-29,-6,-7,-8,-9,-10,-12,-13,-14,-15,-11,-30,-28,-31,-32,]),'YES':([0,12,13,18,19,20,],[3,3,3,3,3,3,]),'NO':([0,12,13,18,19,20,],[4,4,4,4,4,4,]),'PYTHON':([0,12,13,18,19,20,],[5,5,5,5,5,5,]),'SINCE':([0,12,13,18,19,20,],[6,6,6,6,6,6,]),'UNTIL':([0,12,13,18,19,20,],[9,9,9,9,9,9,]),'FILTER':([0,12,13,18,19,20,],[10,10,10,10,10,10,]),'LPAREN':([0,12,13,18,19,20,],[12,12,12,12,12,12,]),'NOT':([0,12,13,18,19,20,],[13,13,13,13,13,13,]),'ID':([0,10,12,13,18,19,20,28,29,30,31,32,33,34,35,36,37,38,],[11,25,11,11,11,11,11,44,-26,-27,-19,-20,-21,-22,-23,-24,-25,44,]),'NUMBER':([0,6,9,12,13,18,19,20,28,29,30,31,32,33,34,35,36,37,38,],[7,21,23,7,7,7,7,7,7,-26,-27,-19,-20,-21,-22,-23,-24,-25,7,]),'STRING':([0,6,9,12,13,18,19,20,28,29,30,31,32,33,34,35,36,37,38,],[8,22,24,8,8,8,8,8,8,-26,-27,-19,-20,-21,-22,-23,-24,-25,8,]),'REGEXP':([0,12,13,18,19,20,29,31,32,33,],[17,17,17,17,17,17,17,-19,-20,-21,]),'AND':([2,3,4,5,7,8,11,16,17,21,22,23,24,25,26,27,39,40,41,42,43,44,45,46,],[18,-3,-4,-5,-16,-17,-33,-18,-29,-6,-7,-8,-9,-10,18,-12,-13,-14,-15,-11,-30,-28,-31,-32,]),'OR':([2,3,4,5,7,8,11,16,17,21,22,23,24,25,26,27,39,40,41,42,43,44,45,46,],[19,-3,-4,-5,-16,-17,-33,-18,-29,-6,-7,-8,-9,-10,19,-12,-13,-14,-15,-11,-30,-28,-31,-32,]),'XOR':([2,3,4,5,7,8,11,16,17,21,22,23,24,25,26,27,39,40,41,42,43,44,45,46,],[20,-3,-4,-5,-16,-17,-33,-18,-29,-6,-7,-8,-9,-10,20,-12,-13,-14,-15,-11,-30,-28,-31,-32,]),'RPAREN':([3,4,5,7,8,11,16,17,21,22,23,24,25,26,27,39,40,41,42,43,44,45,46,],[-3,-4,-5,-16,-17,-33,-18,-29,-6,-7,-8,-9,-10,42,-12,-13,-14,-15,-11,-30,-28,-31,-32,]),'EQ':([7,8,11,14,15,16,17,],[-16,-17,-28,31,31,-18,-29,]),'EQEQ':([7,8,11,14,15,16,17,],[-16,-17,-28,32,32,-18,-29,]),'NE':([7,8,11,14,15,16,17,],[-16,-17,-28,33,33,-18,-29,]),'LT':([7,8,11,14,16,],[-16,-17,-28,34,-18,]),'LTE':([7,8,11,14,16,],[-16,-17,-28,35,-18,]),'GT':([7,8,11,14,16,],[-16,-17,-28,36,-18,]),'GTE':([7,8,11,14,16,],[-16,-17,-28,37,-18,]),}
+
+_lr_action = {}
+for _k, _v in _lr_action_items.items():
+   for _x,_y in zip(_v[0],_v[1]):
+      if not _x in _lr_action:  _lr_action[_x] = {}
+      _lr_action[_x][_k] = _y
+del _lr_action_items
+
+_lr_goto_items = {'fil':([0,],[1,]),'exp':([0,12,13,18,19,20,],[2,26,27,39,40,41,]),'val':([0,12,13,18,19,20,28,38,],[14,14,14,14,14,14,43,46,]),'re':([0,12,13,18,19,20,29,],[15,15,15,15,15,15,45,]),'id':([0,12,13,18,19,20,28,38,],[16,16,16,16,16,16,16,16,]),'op':([14,],[28,]),'eop':([14,15,],[29,38,]),'rop':([14,],[30,]),}
+
+_lr_goto = {}
+for _k, _v in _lr_goto_items.items():
+   for _x, _y in zip(_v[0], _v[1]):
+       if not _x in _lr_goto: _lr_goto[_x] = {}
+       _lr_goto[_x][_k] = _y
+del _lr_goto_items
+_lr_productions = [
+  ("S' -> fil","S'",1,None,None,None),
+  ('fil -> exp','fil',1,'p_fil_exp','filters.py',1143),
+  ('fil -> <empty>','fil',0,'p_fil_empty','filters.py',1147),
+  ('exp -> YES','exp',1,'p_exp_yes','filters.py',1151),
+  ('exp -> NO','exp',1,'p_exp_no','filters.py',1155),
+  ('exp -> PYTHON','exp',1,'p_exp_python','filters.py',1159),
+  ('exp -> SINCE NUMBER','exp',2,'p_exp_since','filters.py',1167),
+  ('exp -> SINCE STRING','exp',2,'p_exp_since','filters.py',1168),
+  ('exp -> UNTIL NUMBER','exp',2,'p_exp_since','filters.py',1169),
+  ('exp -> UNTIL STRING','exp',2,'p_exp_since','filters.py',1170),
+  ('exp -> FILTER ID','exp',2,'p_exp_filter','filters.py',1178),
+  ('exp -> LPAREN exp RPAREN','exp',3,'p_exp_parens','filters.py',1182),
+  ('exp -> NOT exp','exp',2,'p_exp_not','filters.py',1186),
+  ('exp -> exp AND exp','exp',3,'p_exp_and','filters.py',1190),
+  ('exp -> exp OR exp','exp',3,'p_exp_or','filters.py',1194),
+  ('exp -> exp XOR exp','exp',3,'p_exp_xor','filters.py',1198),
+  ('val -> NUMBER','val',1,'p_val','filters.py',1203),
+  ('val -> STRING','val',1,'p_val','filters.py',1204),
+  ('val -> id','val',1,'p_val','filters.py',1205),
+  ('eop -> EQ','eop',1,'p_eqop','filters.py',1211),
+  ('eop -> EQEQ','eop',1,'p_eqop','filters.py',1212),
+  ('eop -> NE','eop',1,'p_eqop','filters.py',1213),
+  ('rop -> LT','rop',1,'p_relop','filters.py',1219),
+  ('rop -> LTE','rop',1,'p_relop','filters.py',1220),
+  ('rop -> GT','rop',1,'p_relop','filters.py',1221),
+  ('rop -> GTE','rop',1,'p_relop','filters.py',1222),
+  ('op -> eop','op',1,'p_op','filters.py',1228),
+  ('op -> rop','op',1,'p_op','filters.py',1229),
+  ('id -> ID','id',1,'p_id','filters.py',1235),
+  ('re -> REGEXP','re',1,'p_re','filters.py',1241),
+  ('exp -> val op val','exp',3,'p_exp_comparison','filters.py',1247),
+  ('exp -> val eop re','exp',3,'p_exp_recompare','filters.py',1265),
+  ('exp -> re eop val','exp',3,'p_exp_recompare','filters.py',1266),
+  ('exp -> ID','exp',1,'p_truth','filters.py',1279),
+]
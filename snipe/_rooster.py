@@ -47,6 +47,7 @@ import urllib.parse
 import base64
 import logging
 import functools
+import time
 import concurrent.futures
 
 import aiohttp
@@ -61,8 +62,34 @@ class RoosterException(Exception):
     pass
 
 
+class Connector(aiohttp.TCPConnector):
+    '''
+    A connection pool that keeps track of how often it had to make a new
+    connection (and handshake) rather than reusing a kept-alive one.
+    '''
+    def __init__(self, *args, **kw):
+        super().__init__(*args, **kw)
+        self.requests = 0
+        self.handshakes = 0
+        self.handshake_time = 0.0
+
+    @asyncio.coroutine
+    def connect(self, req):
+        self.requests += 1
+        return (yield from super().connect(req))
+
+    @asyncio.coroutine
+    def _create_connection(self, req, *args, **kw):
+        t0 = time.monotonic()
+        try:
+            return (yield from super()._create_connection(req, *args, **kw))
+        finally:
+            self.handshakes += 1
+            self.handshake_time += time.monotonic() - t0
+
+
 class Rooster:
-    def __init__(self, url, service):
+    def __init__(self, url, service, connections=4):
         self.token = None
         self.expires = None
         self.url = url
@@ -76,6 +103,22 @@ class Rooster:
         self.tailid = 0
         self.log = logging.getLogger('Rooster.%x' % (id(self),))
         self.executor = concurrent.futures.ProcessPoolExecutor(1)
+        # shared by every API call, so backfills and the like reuse
+        # kept-alive connections instead of handshaking each time
+        self.connector = Connector()
+        self.slots = asyncio.Semaphore(connections)
+
+    def stats(self):
+        c = self.connector
+        return [
+            ('http requests', c.requests),
+            ('reused connections', c.requests - c.handshakes),
+            ('handshake time (avg)', '%.3fs' % (
+                c.handshake_time / c.handshakes if c.handshakes else 0)),
+            ]
+
+    def close(self):
+        self.connector.close()
 
     def run_in_exile(self, *args):
         loop = asyncio.get_event_loop()
@@ -319,27 +362,18 @@ class Rooster:
         if self.token is not None:
             headers['Authorization'] = 'Bearer ' + self.token
 
-        response = yield from aiohttp.request(
-            method,
-            self.url + url,
-            data = data,
-            params = params,
-            headers = headers,
-            )
-
-        result = []
-        while True:
-            try:
-                x = (yield from response.content.read())
-                if x == b'':
-                    break
-                result.append(x)
-            except aiohttp.EofStream:
-                break
-
-        response.close()
+        with (yield from self.slots):
+            response = yield from aiohttp.request(
+                method,
+                self.url + url,
+                data = data,
+                params = params,
+                headers = headers,
+                connector = self.connector,
+                )
+            # reads the whole body and hands the connection back to the pool
+            result = yield from response.read()
 
-        result = b''.join(result)
         result = result.decode('utf-8')
         try:
             result = json.loads(result)
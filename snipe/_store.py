@@ -0,0 +1,130 @@
+# -*- encoding: utf-8 -*-
+# Copyright © 2014 Karl Ramm
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+# CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS
+# BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+
+'''
+snipe._store
+------------
+
+An on-disk copy of a backend's messages, in sqlite.
+'''
+
+
+import json
+import os
+import sqlite3
+
+
+class MessageStore:
+    '''Messages, stored as the JSON they came in, by id.
+
+    Along with the JSON goes each message's time and ``seq`` (see
+    ``SnipeMessage``), which is the order they come back out in.  What
+    gets stored is up to the backend; the ``meta`` table is for it to keep
+    notes in.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        # it's people's mail, more or less; sqlite makes the -wal and -shm
+        # files with the same permissions as the database, so set those
+        # before it gets to it
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o600))
+        for name in (path, path + '-wal', path + '-shm'):
+            if os.path.exists(name):
+                os.chmod(name, 0o600)
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        with self.db:
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS messages ('
+                ' id TEXT PRIMARY KEY, time REAL, seq INTEGER, json TEXT)')
+            self.db.execute(
+                'CREATE INDEX IF NOT EXISTS messages_order'
+                ' ON messages (time, seq)')
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS meta ('
+                ' key TEXT PRIMARY KEY, value TEXT)')
+
+    def __len__(self):
+        return self.db.execute('SELECT count(*) FROM messages').fetchone()[0]
+
+    def add(self, rows):
+        '''Store ``(id, time, seq, data)`` tuples, skipping ids we have.'''
+        with self.db:
+            self.db.executemany(
+                'INSERT OR IGNORE INTO messages VALUES (?, ?, ?, ?)',
+                ((msgid, when, seq, json.dumps(data))
+                 for (msgid, when, seq, data) in rows))
+
+    def newest(self, count):
+        '''Return the newest ``count`` messages as ``(seq, data)`` pairs,
+        oldest first.'''
+        return self._rows(
+            'SELECT seq, json FROM messages'
+            ' ORDER BY time DESC, seq DESC LIMIT ?', (count,))
+
+    def older(self, when, seq, count):
+        '''Return the ``count`` messages just before ``(when, seq)`` as
+        ``(seq, data)`` pairs, oldest first.'''
+        return self._rows(
+            'SELECT seq, json FROM messages'
+            ' WHERE time < ? OR (time = ? AND seq < ?)'
+            ' ORDER BY time DESC, seq DESC LIMIT ?',
+            (when, when, seq, count))
+
+    def _rows(self, query, args):
+        rows = self.db.execute(query, args).fetchall()
+        rows.reverse()
+        return [(seq, json.loads(data)) for (seq, data) in rows]
+
+    def seqs(self):
+        '''Return the lowest and highest ``seq`` stored (or ``None``s).'''
+        return self.db.execute(
+            'SELECT min(seq), max(seq) FROM messages').fetchone()
+
+    def clear(self):
+        with self.db:
+            self.db.execute('DELETE FROM messages')
+            self.db.execute('DELETE FROM meta')
+
+    def __getitem__(self, key):
+        row = self.db.execute(
+            'SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def __setitem__(self, key, value):
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, value))
+
+    def close(self):
+        self.db.close()
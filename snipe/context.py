@@ -83,6 +83,9 @@ class Context:
                 }
             }
         self.context = self
+        # bumped whenever the configuration is read or written, so things
+        # derived from it know to recompute themselves
+        self.conf_generation = 0
         self.directory = os.path.join(os.path.expanduser('~'), '.snipe')
         self.conf_read()
 
@@ -104,6 +107,7 @@ class Context:
                 roost.Roost(self),
                 irccloud.IRCCloud(self),
                 ],)
+        self.rules = messager.Rules(self)
         self.status = window.StatusLine(self.ui)
         self.ui.initial(
             lambda: messager.Messager(self.ui), statusline=self.status)
@@ -111,6 +115,7 @@ class Context:
 
     def conf_read(self):
         path = os.path.join(self.directory, 'config')
+        self.conf_generation += 1
         try:
             if os.path.exists(path):
                 self.conf = json.load(open(path))
@@ -123,6 +128,22 @@ class Context:
         tmp = os.path.join(self.directory, ',' + name)
         backup = os.path.join(self.directory, name + '~')
 
+        self.conf_generation += 1
+
+        self.ensure_directory()
+
+        fp = open(tmp, 'w')
+        json.dump(self.conf, fp)
+        fp.write('\n')
+        fp.close()
+        if os.path.exists(path):
+            with contextlib.suppress(OSError):
+                os.unlink(backup)
+            os.link(path, backup)
+        os.rename(tmp, path)
+
+    def ensure_directory(self):
+        """Make sure ``directory`` exists (and is private)."""
         if not os.path.isdir(self.directory):
             os.mkdir(self.directory)
             os.chmod(self.directory, 0o700)
@@ -141,16 +162,6 @@ class Context:
                 else:
                     self.log.debug('%s: %s', ' '.join(cmd), out)
 
-        fp = open(tmp, 'w')
-        json.dump(self.conf, fp)
-        fp.write('\n')
-        fp.close()
-        if os.path.exists(path):
-            with contextlib.suppress(OSError):
-                os.unlink(backup)
-            os.link(path, backup)
-        os.rename(tmp, path)
-
     # kill ring
     def copy(self, data, append=None):
         if not self.killring or append is None:
@@ -33,10 +33,16 @@ snipe.filters
 -------------
 '''
 
+import calendar
+import collections
+import datetime
 import logging
 import operator
 import re
+import sre_parse
 import functools
+import math
+import time
 
 import ply.lex
 import ply.yacc
@@ -76,11 +82,76 @@ class Filter(object):
     def gname(self):
         return self.name or self.__class__.__name__.lower()
 
+    def expression(self, env):
+        """Return the text of a python expression that evaluates this
+        filter against ``m`` (and ``state``) to ``True`` or ``False``,
+        stashing any values it needs in the dictionary ``env``.
+
+        The default just calls the filter object."""
+        return 'bool(%s(m, state))' % (constant(env, self),)
+
+    def plan(self, index):
+        """Return a list of posting lists that between them hold every
+        message this filter could match, or ``None`` if the filter can't
+        be answered from the indexes kept by ``index`` (a
+        :class:`snipe.messagelist.MessageList`)."""
+        return None
+
+    def timerange(self):
+        """Return ``(earliest, latest)`` such that any message this filter
+        matches has ``earliest <= m.time <= latest``."""
+        return -float('inf'), float('inf')
+
+    def cost(self):
+        """Roughly how expensive the filter is to evaluate, relative to
+        looking at a field."""
+        return 10
+
+    def optimize(self):
+        """Return an equivalent filter that does the cheap tests first."""
+        return self
+
+    def mask(self, columns, rows):
+        """Return a boolean array of which of the messages in ``columns``
+        (a :class:`snipe.messagelist.Columns`) that are picked out by
+        ``rows`` (another boolean array) this filter matches.
+
+        The default asks about each of them in turn."""
+        return columns.sift(rows, compiled(self))
+
+    def vectorized(self, columns):
+        """Whether :meth:`mask` can answer from ``columns`` without asking
+        about each message in turn."""
+        return False
+
+    def cacheable(self):
+        """Whether what the filter says about a message can be kept, that
+        is, whether it only depends on the message (and the
+        configuration)."""
+        return True
+
+    def compile(self):
+        """Return a function of ``(m, state=None)`` equivalent to the filter,
+        but without the overhead of walking the tree for every message."""
+        env = {}
+        try:
+            source = 'lambda m, state=None: ' + self.expression(env)
+            f = eval(source, env)
+        except (SyntaxError, RuntimeError, MemoryError):
+            # pathologically deep filters can exceed the compiler's limits
+            logging.getLogger('filter').exception('compiling filter %s', self)
+            return self
+        f.source = source
+        return f
+
 
 class Certitude(Filter):
     def __eq__(self, other):
         return self.__class__ is other.__class__
 
+    def cost(self):
+        return 0
+
     def __hash__(self):
         return hash(self.__class__)
 
@@ -89,6 +160,15 @@ class Yes(Certitude):
     def __call__(self, m, state=None):
         return True
 
+    def mask(self, columns, rows):
+        return rows.copy()
+
+    def vectorized(self, columns):
+        return True
+
+    def expression(self, env):
+        return 'True'
+
     def simplify(self, d):
         return True
 
@@ -97,6 +177,21 @@ class No(Certitude):
     def __call__(self, m, state=None):
         return False
 
+    def mask(self, columns, rows):
+        return columns.none()
+
+    def vectorized(self, columns):
+        return True
+
+    def expression(self, env):
+        return 'False'
+
+    def plan(self, index):
+        return []
+
+    def timerange(self):
+        return float('inf'), -float('inf')
+
     def simplify(self, d):
         return False
 
@@ -110,6 +205,24 @@ class Not(Filter):
     def __call__(self, m, state=None):
         return not self.p(m, state)
 
+    def expression(self, env):
+        return '(not %s)' % (self.p.expression(env),)
+
+    def cost(self):
+        return self.p.cost()
+
+    def optimize(self):
+        return Not(self.p.optimize())
+
+    def mask(self, columns, rows):
+        return rows & ~self.p.mask(columns, rows)
+
+    def vectorized(self, columns):
+        return self.p.vectorized(columns)
+
+    def cacheable(self):
+        return self.p.cacheable()
+
     def __str__(self):
         return self.gname() + ' ' + self.parenthesize(self.p)
 
@@ -126,7 +239,7 @@ class Not(Filter):
         result = self.p.simplify(d)
         if isinstance(result, bool):
             return not result
-        return super().simplify(d)
+        return Not(result)
 
 
 class Truth(Filter):
@@ -136,6 +249,26 @@ class Truth(Filter):
     def __call__(self, m, state=None):
         return bool(m.field(self.field))
 
+    def expression(self, env):
+        return 'bool(m.field(%s))' % (constant(env, self.field),)
+
+    def plan(self, index):
+        if self.field not in index.postings:
+            return None
+        return [p for (v, p) in index.postings[self.field].items() if v]
+
+    def cost(self):
+        return 1
+
+    def mask(self, columns, rows):
+        where = columns.where(self.field, True, bool, rows)
+        if where is None:
+            return super().mask(columns, rows)
+        return rows & where
+
+    def vectorized(self, columns):
+        return self.field in columns.fields
+
     def __str__(self):
         return self.field
 
@@ -192,6 +325,35 @@ class Conjunction(Filter):
     def __hash__(self):
         return hash((self.__class__, self.operands))
 
+    def cost(self):
+        return sum(p.cost() for p in self.operands)
+
+    def optimize(self):
+        # the operands commute, so put the cheap ones first, where they
+        # can save us from looking at the others
+        operands = self.combine([p.optimize() for p in self.operands])
+        if len(operands) == 1:
+            return operands[0]
+        return self.__class__(*sorted(operands, key=lambda p: p.cost()))
+
+    def combine(self, operands):
+        """Return ``operands``, with any that can be answered together
+        merged."""
+        return operands
+
+    def vectorized(self, columns):
+        return all(p.vectorized(columns) for p in self.operands)
+
+    def cacheable(self):
+        return all(p.cacheable() for p in self.operands)
+
+    def bulkfirst(self, columns):
+        # the operands that can answer in bulk, then the rest, so that
+        # the rest have fewer messages to ask about
+        return sorted(
+            self.operands,
+            key=lambda p: (not p.vectorized(columns), p.cost()))
+
 
 class And(Conjunction):
     name = 'and'
@@ -202,12 +364,38 @@ class And(Conjunction):
                 return False
         return True
 
+    def expression(self, env):
+        return '(' + ' and '.join(
+            p.expression(env) for p in self.operands) + ')'
+
+    def combine(self, operands):
+        return RECompare.combine(operands, True)
+
+    def mask(self, columns, rows):
+        for p in self.bulkfirst(columns):
+            if not rows.any():
+                break
+            rows = p.mask(columns, rows)
+        return rows
+
+    def plan(self, index):
+        # any one operand will do, so take the one with the fewest messages
+        plans = [p.plan(index) for p in self.operands]
+        plans = [plan for plan in plans if plan is not None]
+        if not plans:
+            return None
+        return min(plans, key=lambda plan: sum(len(p) for p in plan))
+
+    def timerange(self):
+        ranges = [p.timerange() for p in self.operands]
+        return max(lo for (lo, hi) in ranges), min(hi for (lo, hi) in ranges)
+
     def simplify(self, d):
         operands = []
         for p in self.operands:
             result = p.simplify(d)
             if not isinstance(result, bool):
-                operands.append(p)
+                operands.append(result)
             elif result is False:
                 return False
             elif result is True:
@@ -229,12 +417,42 @@ class Or(Conjunction):
                 return True
         return False
 
+    def expression(self, env):
+        return '(' + ' or '.join(
+            p.expression(env) for p in self.operands) + ')'
+
+    def combine(self, operands):
+        return RECompare.combine(operands, False)
+
+    def mask(self, columns, rows):
+        result = columns.none()
+        for p in self.bulkfirst(columns):
+            if not rows.any():
+                break
+            found = p.mask(columns, rows)
+            result |= found
+            rows = rows & ~found
+        return result
+
+    def plan(self, index):
+        result = []
+        for p in self.operands:
+            plan = p.plan(index)
+            if plan is None:
+                return None
+            result.extend(plan)
+        return result
+
+    def timerange(self):
+        ranges = [p.timerange() for p in self.operands]
+        return min(lo for (lo, hi) in ranges), max(hi for (lo, hi) in ranges)
+
     def simplify(self, d):
         operands = []
         for p in self.operands:
             result = p.simplify(d)
             if not isinstance(result, bool):
-                operands.append(p)
+                operands.append(result)
             elif result is True:
                 return True
             elif result is False:
@@ -253,11 +471,29 @@ class Xor(Conjunction):
     def __call__(self, m, state=None):
         return len([True for p in self.operands if p(m, state)]) == 1
 
+    def expression(self, env):
+        return '(' + ' + '.join(
+            p.expression(env) for p in self.operands
+            ) + ' == 1)'
+
+    def mask(self, columns, rows):
+        one, many = columns.none(), columns.none()
+        for p in self.operands:
+            found = p.mask(columns, rows)
+            many |= one & found
+            one ^= found
+        return one & ~many
+
 
 class Python(Filter):
     def __init__(self, string):
         super(Python, self).__init__()
         self.string = string
+        # compile the bare expression first so that any SyntaxError is
+        # reported against what the user actually wrote
+        compile(string, '<filter>', 'eval')
+        self.function = eval(
+            'lambda m, state: (\n' + string + '\n)', {})
 
     def __repr__(self):
         return '%s(%s)' % (
@@ -267,7 +503,7 @@ class Python(Filter):
 
     def __call__(self, m, state=None):
         try:
-            return eval(self.string, {}, {'m': m, 'state': state})
+            return self.function(m, state)
         except:
             self.log.exception(
                 'executing python filter %s on %s',
@@ -280,11 +516,19 @@ class Python(Filter):
     def __hash__(self):
         return hash((self.__class__, self.string))
 
+    def cost(self):
+        return 20
+
+    def cacheable(self):
+        # it could be looking at the clock, or anything else
+        return False
+
 
 class FilterLookup(Filter):
     def __init__(self, name):
         super(FilterLookup, self).__init__()
         self.filtername = name
+        self.resolved = None
 
     def __repr__(self):
         return '%s(%s)' % (
@@ -293,33 +537,36 @@ class FilterLookup(Filter):
             )
 
     def __call__(self, m, state=None):
-        if state is not None:
-            if self.filtername in state.setdefault('filterlookup', set()):
-                return False
-        else:
-            state = {'filterlookup': set()}
-
-        state['filterlookup'].add(self.filtername)
-
-        conf = m.backend.context.conf
-        self.log.debug('looking up filter %s', self.filtername)
-        text = conf.get('filter', {}).get(self.filtername)
-        if not text:
-            self.log.debug('empty (%s)', repr(text))
-            return False
-
-        try:
-            self.log.debug('%s: %s', self.filtername, text)
-            return makefilter(text)(m, state)
-        except:
-            self.log.exception('in filter %s', self.filtername)
-            return False
+        return self.resolve(m.backend.context)(m)
+
+    def expression(self, env):
+        return 'bool(%s(m.backend.context)(m))' % (
+            constant(env, self.resolve),)
+
+    def resolve(self, context):
+        """Return the compiled filter this name refers to, with any filters
+        it refers to in turn expanded.  The result is kept until the
+        context's configuration changes."""
+        generation = getattr(context, 'conf_generation', None)
+        if self.resolved is not None and generation is not None:
+            rcontext, rgeneration, f = self.resolved
+            if rcontext is context and rgeneration == generation:
+                return f
+
+        f = self.simplify({'context': context, 'relative': True})
+        if isinstance(f, bool):
+            f = Yes() if f else No()
+        f = compiled(f)
+        self.resolved = (context, generation, f)
+        return f
 
     def simplify(self, d):
-        if self.filtername in d.setdefault('filterlookup', set()):
+        # the names we're already inside of; referring to one of them again
+        # would loop forever, so a recursive reference matches nothing
+        seen = d.get('filterlookup', frozenset())
+        if self.filtername in seen:
             return False
-
-        d['filterlookup'].add(self.filtername)
+        d = dict(d, filterlookup=seen | {self.filtername})
 
         conf = d['context'].conf
         self.log.debug('looking up filter %s', self.filtername)
@@ -346,6 +593,128 @@ class FilterLookup(Filter):
     def __str__(self):
         return 'filter ' + self.filtername
 
+    def cacheable(self):
+        # what's behind the name might not be; simplify() to find out
+        return False
+
+
+class TimeBound(Filter):
+    """Messages on one side of a point in time, given either as a number
+    of seconds since the epoch or as a string like ``"yesterday"`` or
+    ``"2015-06-01 12:00"``."""
+
+    def __init__(self, when):
+        super().__init__()
+        self.when = when
+        self.time() # complain now if it doesn't parse
+
+    def time(self):
+        if isinstance(self.when, str):
+            # relative times like "an hour ago" drift, so don't hang on
+            # to what they mean for more than a minute
+            return parsetime(self.when, int(time.time() // 60))
+        return self.when
+
+    def simplify(self, d):
+        # pinning down "an hour ago" is fine for a walk, but not for
+        # something that's kept around, which can ask for relative times
+        # to be left alone with 'relative' in d
+        if isinstance(self.when, str) and not d.get('relative'):
+            return self.__class__(self.time())
+        return self
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, repr(self.when))
+
+    def __str__(self):
+        if isinstance(self.when, str):
+            return '%s "%s"' % (
+                self.gname(),
+                self.when.replace('\\', '\\\\').replace('"', '\\"'))
+        return '%s %s' % (self.gname(), repr(self.when))
+
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and self.when == other.when
+
+    def __hash__(self):
+        return hash((self.__class__, self.when))
+
+    def cost(self):
+        return 1
+
+    def cacheable(self):
+        # "an hour ago" moves; simplify() pins it down
+        return not isinstance(self.when, str)
+
+
+class Since(TimeBound):
+    name = 'since'
+
+    def __call__(self, m, state=None):
+        return m.time >= self.time()
+
+    def expression(self, env):
+        if isinstance(self.when, str):
+            return super().expression(env)
+        return '(m.time >= %s)' % (constant(env, self.when),)
+
+    def timerange(self):
+        return self.time(), float('inf')
+
+    def mask(self, columns, rows):
+        return rows & (columns.time >= self.time())
+
+    def vectorized(self, columns):
+        return True
+
+
+class Until(TimeBound):
+    name = 'until'
+
+    def __call__(self, m, state=None):
+        return m.time < self.time()
+
+    def expression(self, env):
+        if isinstance(self.when, str):
+            return super().expression(env)
+        return '(m.time < %s)' % (constant(env, self.when),)
+
+    def timerange(self):
+        return -float('inf'), self.time()
+
+    def mask(self, columns, rows):
+        return rows & (columns.time < self.time())
+
+    def vectorized(self, columns):
+        return True
+
+
+@functools.lru_cache(maxsize=64)
+def parsetime(s, minute=None):
+    """Turn a description of a time into seconds since the epoch.  (The
+    ``minute`` is just there to age out the cache.)
+
+    A date without a time of day means the (local) midnight it starts
+    with, and a day of the week on its own means the most recent one.
+    """
+    import parsedatetime
+    when, parsed = parsedatetime.Calendar().parse(s)
+    if not parsed:
+        raise ValueError('unrecognized time: %s' % (s,))
+    if parsed != 1: # 1 is a date, 2 a time, 3 both
+        return time.mktime(when)
+    date = datetime.date(*when[:3])
+    if s.strip().lower() in WEEKDAYS:
+        # parsedatetime looks ahead for these
+        today = datetime.date.today()
+        while date > today:
+            date -= datetime.timedelta(days=7)
+    return time.mktime(date.timetuple())
+
+
+WEEKDAYS = frozenset(
+    name.lower() for name in list(calendar.day_name) + list(calendar.day_abbr))
+
 
 class Comparison(Filter):
     def __init__(self, op, field, value):
@@ -400,31 +769,106 @@ class Comparison(Filter):
             return self
         return self.do(self.op, d[self.field], v)
 
+    def cost(self):
+        # looking up the other side if it's a field, and comparing
+        return 3 if isinstance(self.value, Identifier) else 2
+
+    def left(self, env):
+        return 'm.field(%s, %s)' % (
+            constant(env, self.field), constant(env, self.canon))
+
+    def right(self, env):
+        if isinstance(self.value, Identifier):
+            return 'm.field(%s, %s)' % (
+                constant(env, str(self.value)), constant(env, self.canon))
+        return constant(env, self.value)
+
 
 class Compare(Comparison):
+    operators = {
+        '=': operator.eq,
+        '==': operator.eq,
+        '!=': operator.ne,
+        '<': operator.lt,
+        '<=': operator.le,
+        '>': operator.gt,
+        '>=': operator.ge,
+        }
+
+    def timerange(self):
+        if self.field != 'time' or type(self.value) not in (int, float):
+            return super().timerange()
+        # m.field('time') is truncated to an integer
+        v = self.value
+        return {
+            '=': (v, v + 1),
+            '==': (v, v + 1),
+            '<': (-float('inf'), v),
+            '<=': (-float('inf'), v + 1),
+            '>': (v, float('inf')),
+            '>=': (v, float('inf')),
+            }.get(self.op, (-float('inf'), float('inf')))
+
     @staticmethod
     def do(op, left, right):
-        f = {
-            '=': operator.eq,
-            '==': operator.eq,
-            '!=': operator.ne,
-            '<': operator.lt,
-            '<=': operator.le,
-            '>': operator.gt,
-            '>=': operator.ge,
-            }[op]
         try:
-            return f(left, right)
+            return Compare.operators[op](left, right)
         except:
             #XXX log a snarky comment where the user will see?
-            self.log.exception('in filter')
+            logging.getLogger('filter.Compare').exception('in filter')
             return False
 
+    def plan(self, index):
+        # the posting lists are keyed by canonicalized values, so only
+        # '=' can use them
+        if self.op != '=' or isinstance(self.value, Identifier):
+            return None
+        if self.field in index.postings:
+            p = index.postings[self.field].get(self.value)
+            return [] if p is None else [p]
+        if index.words is not None and self.field == index.words.field:
+            p = index.words.search([str(self.value)])
+            return None if p is None else [p]
+        return None
+
+    def expression(self, env):
+        if self.op in ('=', '=='):
+            return '(%s == %s)' % (self.left(env), self.right(env))
+        elif self.op == '!=':
+            return '(%s != %s)' % (self.left(env), self.right(env))
+        # ordering comparisons can raise, so they go through do()
+        return 'bool(%s(%s, %s, %s))' % (
+            constant(env, self.do),
+            constant(env, self.op),
+            self.left(env),
+            self.right(env),
+            )
+
     @staticmethod
     def static(op, left, right):
         result = Compare.do(op, left, right)
         return Yes() if result else No()
 
+    def seconds(self):
+        # whether this compares m.field('time') with a number
+        return self.field == 'time' and type(self.value) in (int, float)
+
+    def mask(self, columns, rows):
+        if isinstance(self.value, Identifier):
+            return super().mask(columns, rows)
+        if self.seconds():
+            return rows & self.operators[self.op](columns.seconds, self.value)
+        where = columns.where(
+            self.field, self.canon,
+            lambda value: self.do(self.op, value, self.value), rows)
+        if where is None:
+            return super().mask(columns, rows)
+        return rows & where
+
+    def vectorized(self, columns):
+        return not isinstance(self.value, Identifier) and (
+            self.seconds() or self.field in columns.fields)
+
 
 class RECompare(Comparison):
     def __init__(self, *args):
@@ -434,6 +878,44 @@ class RECompare(Comparison):
         except:
             self.log.exception('compiling regexp: %s', self.value)
             self.re = None
+        # cheaper ways of asking whether the regexp matches
+        self.substring = None
+        self.screened = None
+        if self.re is not None:
+            self.substring = substring(self.value)
+            if self.substring is None:
+                self.screened = screener(self.re.match, prescreen(self.value))
+
+    @classmethod
+    def combine(cls, operands, negated):
+        """Merge the regexp comparisons among ``operands`` that are
+        (if ``negated``, aren't) matches on the same field into one, with
+        the regexps as alternatives, and return the new list of operands.
+
+        (So ``or`` can combine matches, and ``and`` non-matches.)"""
+        groups = collections.OrderedDict()
+        result = []
+        for p in operands:
+            if isinstance(p, cls) and p.mergeable() \
+                    and (p.op[0] == '!') == negated:
+                groups.setdefault((p.op, p.field), []).append(p)
+            else:
+                result.append(p)
+        for (op, field), ps in groups.items():
+            if len(ps) > 1:
+                merged = cls(
+                    op, field, '|'.join('(?:%s)' % (p.value,) for p in ps))
+                if merged.re is not None:
+                    ps = [merged]
+            result.extend(ps)
+        return result
+
+    def mergeable(self):
+        # numbered groups and flags wouldn't survive being put next to
+        # other regexps
+        return (
+            self.re is not None and not self.re.groups
+            and self.re.flags == re.compile('', re.DOTALL).flags)
 
     @staticmethod
     def do(op, regexp, value):
@@ -458,6 +940,46 @@ class RECompare(Comparison):
     def __call__(self, m, state=None):
         return self.do(self.op, self.re, str(m.field(self.field, self.canon)))
 
+    def cost(self):
+        return 5
+
+    def mask(self, columns, rows):
+        # each distinct value only needs matching once
+        where = columns.where(
+            self.field, self.canon,
+            lambda value: self.do(self.op, self.re, str(value)), rows)
+        if where is None:
+            return super().mask(columns, rows)
+        return rows & where
+
+    def vectorized(self, columns):
+        return self.field in columns.fields
+
+    def plan(self, index):
+        if (self.op[0] == '!' or self.re is None or index.words is None
+                or self.field != index.words.field):
+            return None
+        strings = literals(self.value)
+        if not strings:
+            return None
+        p = index.words.search(strings)
+        return None if p is None else [p]
+
+    def expression(self, env):
+        if self.re is None:
+            return 'False'
+        if self.substring is not None:
+            test = '(%s in str(%s))' % (
+                constant(env, self.substring), self.left(env))
+        elif self.screened is not None:
+            test = '%s(%s)' % (constant(env, self.screened), self.left(env))
+        else:
+            test = '(%s(str(%s)) is not None)' % (
+                constant(env, self.re.match), self.left(env))
+        if self.op[0] == '!':
+            return '(not %s)' % (test,)
+        return test
+
     def __str__(self):
         return '%s %s /%s/' % (
             self.field,
@@ -479,6 +1001,9 @@ class Lexeme:
     def __eq__(self, other):
         return self.__class__ is other.__class__ and self.value == other.value
 
+    def __hash__(self):
+        return hash((self.__class__, self.value))
+
 
 class Identifier(Lexeme):
     pass
@@ -525,6 +1050,8 @@ class Lexer(PlyShim):
         'OR',
         'XOR',
         'NOT',
+        'SINCE',
+        'UNTIL',
         )
 
     def t_NUMBER(self, t):
@@ -554,6 +1081,8 @@ class Lexer(PlyShim):
             'filter': 'FILTER',
             'yes': 'YES',
             'no': 'NO',
+            'since': 'SINCE',
+            'until': 'UNTIL',
             }
 
         t.type = word.get(t.value, 'ID')
@@ -592,9 +1121,16 @@ class Lexer(PlyShim):
 
 
 class Parser(PlyShim):
+    # The LALR tables are shipped pregenerated in _parsetab (see ``make
+    # parsetab``); if they're missing or out of date with the grammar
+    # below, ply quietly builds them again.
+    tabmodule = __package__ + '._parsetab'
+
     def __init__(self, debug=False):
         super().__init__()
-        self.parser = ply.yacc.yacc(module=self, write_tables=False, debug=debug)
+        self.parser = ply.yacc.yacc(
+            module=self, tabmodule=self.tabmodule, write_tables=False,
+            debug=debug)
 
     tokens = Lexer.tokens
 
@@ -621,7 +1157,22 @@ class Parser(PlyShim):
 
     def p_exp_python(self, p):
         'exp : PYTHON'
-        p[0] = Python(p[1])
+        try:
+            p[0] = Python(p[1])
+        except SyntaxError as e:
+            self._errors.append(e)
+
+    def p_exp_since(self, p):
+        '''
+        exp : SINCE NUMBER
+            | SINCE STRING
+            | UNTIL NUMBER
+            | UNTIL STRING
+        '''
+        try:
+            p[0] = (Since if p[1] == 'since' else Until)(p[2])
+        except Exception as e:
+            self._errors.append(e)
 
     def p_exp_filter(self, p):
         'exp : FILTER ID'
@@ -737,6 +1288,141 @@ parser = Parser()
 lexer = Lexer()
 
 
+def parse(regexp):
+    """Return ``regexp`` parsed by :mod:`sre_parse`, or ``None`` if it
+    doesn't parse or its literals can't be taken literally."""
+    try:
+        if re.compile(regexp, re.DOTALL).flags & re.IGNORECASE:
+            return None
+        return sre_parse.parse(regexp, re.DOTALL)
+    except:
+        return None
+
+
+def required(subpattern):
+    """Return a list of strings that anything matching the parsed
+    ``subpattern`` must contain."""
+    strings = []
+
+    def walk(subpattern):
+        run = []
+        for op, av in subpattern:
+            if op == sre_parse.LITERAL:
+                run.append(chr(av))
+                continue
+            if run:
+                strings.append(''.join(run))
+                run = []
+            if op == sre_parse.SUBPATTERN:
+                # the arguments vary by python version; newer ones can
+                # turn on flags for just the group
+                if len(av) < 4 or not av[1] & re.IGNORECASE:
+                    walk(av[-1])
+            elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+                lo, hi, item = av
+                if lo > 0:
+                    walk(item)
+        if run:
+            strings.append(''.join(run))
+
+    walk(subpattern)
+    return strings
+
+
+def literals(regexp):
+    """Return a list of strings that anything matching ``regexp`` must
+    contain."""
+    parsed = parse(regexp)
+    if parsed is None:
+        return []
+    return required(parsed)
+
+
+def prescreen(regexp):
+    """Return a list of lists of strings such that anything ``regexp``
+    matches contains all the strings in one of the lists (one list per
+    top-level alternative), or ``None`` if it isn't worth checking first:
+    some alternative requires nothing, or they all start with a literal,
+    which ``re.match`` will give up on quickly enough by itself."""
+    parsed = parse(regexp)
+    if parsed is None or not len(parsed):
+        return None
+    if len(parsed) == 1 and parsed[0][0] == sre_parse.BRANCH:
+        branches = parsed[0][1][1]
+    else:
+        branches = [parsed]
+    screens = [required(branch) for branch in branches]
+    if not all(screens) or all(
+            len(branch) and branch[0][0] == sre_parse.LITERAL
+            for branch in branches):
+        return None
+    return screens
+
+
+def substring(regexp):
+    """If matching ``regexp`` (with ``re.DOTALL``) is the same as
+    containing some string, return the string, otherwise ``None``."""
+    parsed = parse(regexp)
+    if parsed is None:
+        return None
+    items = list(parsed)
+
+    def wildcard(item):
+        op, av = item
+        return (
+            op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+            and av[0] == 0 and av[1] == sre_parse.MAXREPEAT
+            and list(av[2]) == [(sre_parse.ANY, None)])
+
+    if not items or not wildcard(items[0]):
+        return None
+    items = items[1:]
+    if items and wildcard(items[-1]):
+        items = items[:-1]
+    if not items or any(op != sre_parse.LITERAL for (op, av) in items):
+        return None
+    return ''.join(chr(av) for (op, av) in items)
+
+
+def screener(match, screens):
+    """Return a function of a value that says whether ``match`` matches
+    it as a string, checking it for the strings in ``screens`` (from
+    :func:`prescreen`) first, or ``None`` if there's nothing to check."""
+    if not screens:
+        return None
+
+    def screened(value):
+        s = str(value)
+        for strings in screens:
+            for string in strings:
+                if string not in s:
+                    break
+            else:
+                return match(s) is not None
+        return False
+
+    return screened
+
+
+def constant(env, value):
+    """Return an expression for ``value`` in code generated by
+    :meth:`Filter.expression`, adding it to ``env`` if it can't be
+    written as a literal."""
+    if value is None or type(value) in (bool, int, str) or (
+            type(value) is float and math.isfinite(value)):
+        return repr(value)
+    name = '_%d' % (len(env),)
+    env[name] = value
+    return name
+
+
+@functools.lru_cache(maxsize=256)
+def compiled(f):
+    """Memoized :meth:`Filter.compile` of the :meth:`Filter.optimize`
+    version of the filter"""
+    return f.optimize().compile()
+
+
 @functools.lru_cache(maxsize=None)
 def makefilter(s):
     lexer.reset_errors()
@@ -44,9 +44,11 @@ import itertools
 import os
 import pprint
 import math
+import sys
 
 
 from . import messages
+from . import messagelist
 from . import util
 from . import _websocket
 from . import keymap
@@ -59,6 +61,7 @@ IRCCLOUD = 'https://www.irccloud.com'
 class IRCCloud(messages.SnipeBackend):
     name = 'irccloud'
     loglevel = util.Level('log.irccloud', 'IRCCloud')
+    indexed_fields = ('channel', 'sender', 'personal')
 
     floodpause = util.Configurable(
         'irccloud.floodpause',
@@ -71,13 +74,27 @@ class IRCCloud(messages.SnipeBackend):
         'irccloud.backfill_length', 24 * 3600,
         'only backfill this far at a time (seconds)',
         coerce=int)
+    retain = util.Configurable(
+        'irccloud.retain', 0,
+        'keep only this many of the newest messages in memory (0 for no'
+        ' limit); older ones are backfilled again if you go looking',
+        coerce=int)
+    retain_days = util.Configurable(
+        'irccloud.retain_days', 0,
+        'keep only this many days of messages in memory (0 for no limit)',
+        coerce=int)
+    retain_filter = util.Configurable(
+        'irccloud.retain_filter', 'personal',
+        'keep messages that match this filter in memory regardless',
+        validate=filters.validatefilter)
 
     def __init__(self, *args, **kw):
         super().__init__(*args, **kw)
 
         self.reqid_counter = itertools.count()
 
-        self.messages = []
+        self.messages = messagelist.MessageList(
+            indexed=self.indexed_fields, words=True, days=True)
         self.task = asyncio.Task(self.connect())
         self.connections = {}
         self.buffers = {}
@@ -232,16 +249,25 @@ class IRCCloud(messages.SnipeBackend):
                     buf['have_eid'] = m['eid']
             msg = IRCCloudMessage(self, m)
             msglist.append(msg)
-            if len(msglist) > 1 and msglist[-1] < msglist[-2]:
-                msglist.sort()
             return msg
 
     @asyncio.coroutine
     def incoming(self, m):
         msg = yield from self.process_message(self.messages, m)
         if msg is not None:
-            self.startcache = {}
             self.redisplay(msg, msg)
+            self.evict()
+
+    def evict(self):
+        dropped = super().evict()
+        if dropped:
+            # backfill the buffers again from where we stopped keeping
+            # everything
+            eid = int(self.horizon.time * 1000000)
+            for buf in self.buffers.values():
+                if buf.get('have_eid', eid) < eid:
+                    buf['have_eid'] = eid
+        return dropped
 
     @asyncio.coroutine
     def include(self, url):
@@ -257,8 +283,7 @@ class IRCCloud(messages.SnipeBackend):
         included.sort()
 
         if included:
-            self.messages = list(messages.merge([self.messages, included]))
-            self.startcache = {}
+            self.messages.merge(included)
             self.redisplay(included[0], included[-1])
 
     def shutdown(self):
@@ -386,6 +411,7 @@ class IRCCloud(messages.SnipeBackend):
             target = max(
                 target, buf['have_eid'] - self.backfill_length * 1000000)
 
+            self.backfilled = time.time()
             oob_data = yield from self.http_json(
                 'GET',
                 urllib.parse.urljoin(
@@ -427,12 +453,17 @@ class IRCCloud(messages.SnipeBackend):
                 included = included[clip + 1:]
             included.reverse()
 
+            if self.horizon is not None:
+                # behind what we evicted, we kept some of these already
+                included = [m for m in included if self.known(m) is None]
+                if included and included[0].time < self.horizon.time:
+                    self.horizon = included[0]
+
             if included:
                 self.log.debug('merging %d messages', len(included))
                 l = len(self.messages)
-                self.messages = list(messages.merge([self.messages, included]))
+                self.messages.merge(included)
                 self.log.debug('len(self.messages): %d -> %d', l, len(self.messages))
-                self.startcache = {}
                 self.redisplay(included[0], included[-1])
 
         except asyncio.CancelledError:
@@ -449,7 +480,17 @@ class IRCCloud(messages.SnipeBackend):
 
 
 class IRCCloudMessage(messages.SnipeMessage):
+    __slots__ = ('channel', 'unformatted')
+
+    # values that repeat a lot from message to message
+    interned = ('type', 'chan', 'from', 'nick', 'from_name', 'from_host')
+
     def __init__(self, backend, m):
+        m = dict(
+            (sys.intern(key),
+             sys.intern(value)
+             if key in self.interned and isinstance(value, str) else value)
+            for (key, value) in m.items())
         when = m.get('eid', -1)
         if when == -1:
             when = time.time()
@@ -680,6 +721,8 @@ class IRCCloudMessage(messages.SnipeMessage):
 
 
 class IRCCloudUser(messages.SnipeAddress):
+    __slots__ = ('server', 'nick', 'user', 'host')
+
     def __init__(self, backend, server, nick, user, host):
         self.server = server
         self.nick = nick
@@ -698,6 +741,8 @@ class IRCCloudUser(messages.SnipeAddress):
 
 
 class IRCCloudNonAddress(messages.SnipeAddress):
+    __slots__ = ('word',)
+
     def __init__(self, backend, word):
         self.word = word
         super().__init__(backend, ['', word])
@@ -0,0 +1,895 @@
+# -*- encoding: utf-8 -*-
+# Copyright © 2014 Karl Ramm
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+# CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS
+# BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+
+'''
+snipe.messagelist
+-----------------
+
+Sorted storage for a backend's messages.
+'''
+
+
+import array
+import bisect
+import collections
+import datetime
+import itertools
+import math
+import re
+
+try:
+    import numpy
+except ImportError: # it's optional; see MessageList.columns
+    numpy = None
+
+
+# what MessageList.sift's flags say about messages it hasn't asked about
+UNKNOWN = b'\x02'
+
+
+class MessageList:
+    '''A list of messages sorted by time.
+
+    The messages are kept in a list of blocks of about ``BLOCKSIZE``
+    messages, so that adding a chunk of messages at either end, or merging
+    in a few in the middle, only copies the blocks it touches.  Each block
+    has a compact array of its messages' timestamps, so finding a place in
+    the list is a bisection over raw floats rather than a series of calls
+    to ``SnipeMessage.__lt__``.
+
+    Every change bumps ``generation`` and is noted in a short log, so that
+    positions remembered from an earlier generation can be brought up to
+    date with :meth:`revalidate` instead of being thrown away.
+
+    For each of the ``indexed`` field names, ``postings`` maps the
+    (canonicalized) values of that field to a ``MessageList`` of just the
+    messages with that value, so that a filter that only wants a few of
+    them needn't look at all the rest.  If ``words`` is true, ``words`` is
+    a :class:`WordIndex` of the message bodies.  If ``days`` is true,
+    ``days`` counts the messages on each (local) calendar day, by date
+    ordinal.
+
+    :meth:`sift` remembers, for each block, which messages a few recent
+    filters matched, so that walking the same messages with the same
+    filter again needn't ask the filter.
+
+    If numpy is installed, :meth:`columns` gives a :class:`Columns` view
+    of the list for answering a filter about all of the messages at once.
+    '''
+
+    BLOCKSIZE = 512
+    CHANGELOG = 128
+    FILTERS = 8 # how many filters' answers sift remembers
+
+    def __init__(self, iterable=(), indexed=(), words=False, days=False):
+        self._blocks = [] # lists of messages
+        self._times = [] # array('d') of the times in each block
+        self._firsts = array.array('d') # the first time in each block
+        # the position of the first message of each block, plus
+        # self._origin, so that we don't need to renumber everything when
+        # we add to the front
+        self._starts = []
+        self._origin = 0
+        self._len = 0
+        # key -> [a bytearray for each block, with a byte for each of its
+        # messages: 1 if it matched, 0 if it didn't, UNKNOWN if not asked]
+        self._flags = collections.OrderedDict()
+        self._columns = None
+        self.generation = 0
+        self.changes = collections.deque(maxlen=self.CHANGELOG)
+        self.postings = {field: {} for field in indexed}
+        self.words = WordIndex() if words else None
+        self.days = {} if days else None
+        self._dates = [] # sorted keys of self.days
+        self._today = (0, 0, None) # (midnight, next midnight, ordinal)
+        ms = list(iterable)
+        self._extend(ms)
+        self._post(ms)
+
+    def _post(self, ms):
+        # add sorted messages to the posting lists
+        if self.words is not None:
+            self.words.add(ms)
+        if self.days is not None:
+            self._count_days(ms)
+        for field, index in self.postings.items():
+            groups = collections.OrderedDict()
+            for m in ms:
+                groups.setdefault(m.field(field), []).append(m)
+            for value, group in groups.items():
+                postings = index.get(value)
+                if postings is None:
+                    index[value] = self.__class__(group)
+                else:
+                    postings.merge(group)
+
+    def _changed(self, lo, hi, count):
+        # count messages were inserted, all at (old) positions between lo
+        # and hi inclusive
+        self.generation += 1
+        self.changes.append((self.generation, lo, hi, count))
+
+    def revalidate(self, generation, start, point, forward):
+        '''Update a remembered walk through the list.
+
+        ``start`` is where a walk in the direction ``forward`` started, and
+        ``point`` is where it found what it was looking for, as of
+        ``generation``.  Returns the current ``(start, point)``, or ``None``
+        if the list has changed in a way that might change the answer.
+        '''
+        if generation == self.generation:
+            return start, point
+        if not self.changes or self.changes[0][0] > generation + 1:
+            return None # too long ago, we don't remember
+        first, last = (start, point) if forward else (point, start + 1)
+        for (changegen, lo, hi, count) in self.changes:
+            if changegen <= generation:
+                continue
+            if lo > last:
+                continue
+            elif hi < first or (not forward and hi == first):
+                start += count
+                point += count
+                first += count
+                last += count
+            else:
+                return None
+        return start, point
+
+    def __repr__(self):
+        return '<%s %d messages in %d blocks>' % (
+            self.__class__.__name__, len(self), len(self._blocks))
+
+    def __len__(self):
+        return self._len
+
+    def _block(self, i):
+        # which block has position i
+        return bisect.bisect_right(self._starts, i + self._origin) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._len))]
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError('MessageList index out of range')
+        if i == 0:
+            return self._blocks[0][0]
+        if i == self._len - 1:
+            return self._blocks[-1][-1]
+        b = self._block(i)
+        return self._blocks[b][i + self._origin - self._starts[b]]
+
+    def __iter__(self):
+        return itertools.chain.from_iterable(self._blocks)
+
+    def __reversed__(self):
+        for block in reversed(self._blocks):
+            yield from reversed(block)
+
+    @property
+    def times(self):
+        '''A copy of all of the message times, in order.'''
+        times = array.array('d')
+        for t in self._times:
+            times.extend(t)
+        return times
+
+    def iterate(self, point, forward=True):
+        '''Yield ``(position, message)`` pairs starting at ``point``.
+
+        Messages added at the far end while this is in progress will be
+        included.
+        '''
+        while 0 <= point < self._len:
+            b = self._block(point)
+            block = self._blocks[b]
+            offset = point + self._origin - self._starts[b]
+            if forward:
+                for m in itertools.islice(block, offset, None):
+                    yield point, m
+                    point += 1
+            else:
+                for i in range(offset, -1, -1):
+                    yield point, block[i]
+                    point -= 1
+
+    def slices(self, point, forward=True, size=None, grow=False):
+        '''Yield ``(position, messages)`` pairs starting at ``point``, where
+        ``messages`` is a list of up to ``size`` (by default, at most a
+        block's worth of) consecutive messages in the direction of travel,
+        and ``position`` is that of the first of them.  If ``grow``, the
+        first slice is one message long, and each one after that is twice
+        as long, up to ``size``.
+
+        Like :meth:`iterate`, but a slice at a time.
+        '''
+        if size is None:
+            size = self.BLOCKSIZE
+        n = 1 if grow else size
+        while 0 <= point < self._len:
+            b = self._block(point)
+            block = self._blocks[b]
+            offset = point + self._origin - self._starts[b]
+            if forward:
+                chunk = block[offset:offset + n]
+                yield point, chunk
+                point += len(chunk)
+            else:
+                chunk = block[max(offset - n + 1, 0):offset + 1]
+                chunk.reverse()
+                yield point, chunk
+                point -= len(chunk)
+            n = min(n * 2, size)
+
+    def columns(self):
+        '''Return a :class:`Columns` view of the list as it is now, or
+        ``None`` if numpy isn't available.  The indexed fields are the
+        ones it can dictionary-encode.'''
+        if numpy is None:
+            return None
+        columns = self._columns
+        if columns is None or columns.generation != self.generation:
+            columns = self._columns = Columns(
+                list(self), self.times, tuple(self.postings),
+                self.generation)
+        return columns
+
+    def _bulkflags(self, bulk):
+        # the flags for a new key, filled in by bulk if it can
+        mask = None
+        if bulk is not None and self._len:
+            columns = self.columns()
+            if columns is not None:
+                mask = bulk(columns)
+        if mask is None:
+            return [bytearray(UNKNOWN * len(block)) for block in self._blocks]
+        bits = mask.astype(numpy.uint8).tobytes()
+        flags, i = [], 0
+        for block in self._blocks:
+            flags.append(bytearray(bits[i:i + len(block)]))
+            i += len(block)
+        return flags
+
+    def forget(self):
+        '''Forget everything :meth:`sift` has kept, for when the answers
+        might have changed underneath it.'''
+        self._flags.clear()
+
+    def sift(self, point, forward, predicate, key, size=None, bulk=None,
+            grow=False):
+        '''Like :meth:`slices` (``size`` and ``grow`` included), but yield
+        ``(position, messages, flags)``, where ``flags`` has a byte for each
+        of ``messages``, 1 if ``predicate`` is true of it and 0 if not.
+
+        The answers are kept, under ``key``, until the messages they're
+        about go away or ``key`` is one of the least recently used of more
+        than ``FILTERS`` keys.  ``key`` must be something that stands for
+        ``predicate`` and any state it depends on.
+
+        If ``key`` is new and ``bulk`` is given, it's called with
+        :meth:`columns` and can return a boolean array of the answers for
+        all of the messages at once (or ``None`` to ask one at a time).
+        '''
+        if size is None:
+            size = self.BLOCKSIZE
+        flags = self._flags.get(key)
+        if flags is None:
+            if len(self._flags) >= self.FILTERS:
+                self._flags.popitem(last=False)
+            flags = self._flags[key] = self._bulkflags(bulk)
+        else:
+            self._flags.move_to_end(key)
+        n = 1 if grow else size
+        while 0 <= point < self._len:
+            b = self._block(point)
+            block, bits = self._blocks[b], flags[b]
+            offset = point + self._origin - self._starts[b]
+            if forward:
+                lo, hi = offset, offset + n
+            else:
+                lo, hi = max(offset - n + 1, 0), offset + 1
+            i = bits.find(UNKNOWN, lo, hi)
+            if i >= 0:
+                j = bits.rfind(UNKNOWN, lo, hi) + 1
+                bits[i:j] = bytes(
+                    1 if predicate(m) else 0 for m in block[i:j])
+            chunk, chunkbits = block[lo:hi], bits[lo:hi]
+            if forward:
+                yield point, chunk, chunkbits
+                point += len(chunk)
+            else:
+                chunk.reverse()
+                chunkbits.reverse()
+                yield point, chunk, chunkbits
+                point -= len(chunk)
+            n = min(n * 2, size)
+
+    def _count_days(self, ms, step=1):
+        start, end, day = self._today
+        for m in ms:
+            if not start <= m.time < end:
+                if not math.isfinite(m.time):
+                    continue
+                date = datetime.date.fromtimestamp(m.time)
+                start, end = midnight(date), midnight(date, 1)
+                day = date.toordinal()
+            n = self.days.get(day)
+            if n is None:
+                bisect.insort(self._dates, day)
+                self.days[day] = step
+            elif n + step:
+                self.days[day] = n + step
+            else:
+                del self.days[day]
+                del self._dates[bisect.bisect_left(self._dates, day)]
+        self._today = (start, end, day)
+
+    def day(self, date):
+        '''Return ``(count, first, last)``: how many messages there are on
+        ``date``, and the positions of the first and last of them.
+        (``first`` and ``last`` are ``None`` if there aren't any.)'''
+        count = self.days.get(date.toordinal(), 0)
+        if not count:
+            return 0, None, None
+        first = self.locate(midnight(date))
+        return count, first, first + count - 1
+
+    def nextdate(self, date, forward=True):
+        '''Return the nearest date after (or before, if not ``forward``)
+        ``date`` that has any messages, or ``None``.'''
+        if forward:
+            i = bisect.bisect_right(self._dates, date.toordinal())
+            if i < len(self._dates):
+                return datetime.date.fromordinal(self._dates[i])
+        else:
+            i = bisect.bisect_left(self._dates, date.toordinal())
+            if i > 0:
+                return datetime.date.fromordinal(self._dates[i - 1])
+        return None
+
+    def seek(self, start, forward=True):
+        '''Return the position at which a walk from ``start`` should begin.
+
+        That's ``start`` itself if it's here (or something that sorts the
+        same is), otherwise the first position after ``start`` if we're
+        going forward, or the last one before it if we're going backward.
+        A bare time is before (or after) any messages at that time.
+        ``None`` means from the beginning (or end) of the list.
+        '''
+        if start is None:
+            return 0 if forward else self._len - 1
+        left, right = self.span(start)
+        if getattr(start, 'seq', None) is None:
+            return left if forward else right - 1
+        try:
+            return self.index(start, left, right)
+        except ValueError:
+            return left if forward else right - 1
+
+    def span(self, start):
+        '''Return the range of positions of whatever sorts the same as
+        ``start``, which is a time, or a message, which sorts by its time
+        and then by its ``seq``.'''
+        left = self.locate(start)
+        right = self.locate(start, True)
+        seq = getattr(start, 'seq', None)
+        if seq is None or left == right:
+            return left, right
+        # bisect the messages at that time by seq
+        lo, hi = left, right
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[mid].seq < seq:
+                lo = mid + 1
+            else:
+                hi = mid
+        left, hi = lo, right
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self[mid].seq <= seq:
+                lo = mid + 1
+            else:
+                hi = mid
+        return left, lo
+
+    def locate(self, when, right=False):
+        '''Return the position at which a message at time ``when`` would go.
+
+        Like ``bisect.bisect_left`` (or ``bisect_right``, if ``right``),
+        ``when`` can be a time or something with a ``__float__``.
+        '''
+        when = float(when)
+        if right:
+            b = bisect.bisect_right(self._firsts, when) - 1
+            if b < 0:
+                return 0
+            return (
+                self._starts[b] - self._origin
+                + bisect.bisect_right(self._times[b], when))
+        else:
+            b = bisect.bisect_left(self._firsts, when) - 1
+            if b < 0:
+                return 0
+            return (
+                self._starts[b] - self._origin
+                + bisect.bisect_left(self._times[b], when))
+
+    def index(self, m, lo=None, hi=None):
+        '''Return the position of ``m`` in the list.
+
+        Looks for ``m`` itself first, and then for anything that sorts the
+        same.
+        '''
+        when = float(m)
+        if lo is None or hi is None:
+            lo, hi = self.span(m)
+        for i, candidate in self.iterate(lo):
+            if i >= hi:
+                break
+            if candidate is m:
+                return i
+        if lo < hi and self[lo].time == when:
+            return lo
+        raise ValueError('%s not in list' % (repr(m),))
+
+    def _extend(self, ms):
+        # add sorted messages to the end
+        i = 0
+        if self._blocks:
+            room = self.BLOCKSIZE - len(self._blocks[-1])
+            if room > 0:
+                chunk = ms[:room]
+                self._blocks[-1].extend(chunk)
+                self._times[-1].extend(m.time for m in chunk)
+                for flags in self._flags.values():
+                    flags[-1].extend(UNKNOWN * len(chunk))
+                i = len(chunk)
+        while i < len(ms):
+            chunk = ms[i:i + self.BLOCKSIZE]
+            self._blocks.append(chunk)
+            self._times.append(array.array('d', (m.time for m in chunk)))
+            for flags in self._flags.values():
+                flags.append(bytearray(UNKNOWN * len(chunk)))
+            self._firsts.append(chunk[0].time)
+            self._starts.append(self._origin + self._len + i)
+            i += len(chunk)
+        self._len += len(ms)
+
+    def _split(self, seq):
+        # pieces of a block (or of its times or flags) that's gotten too big
+        while len(seq) >= 2 * self.BLOCKSIZE:
+            yield seq[:self.BLOCKSIZE]
+            seq = seq[self.BLOCKSIZE:]
+        yield seq
+
+    def _reindex(self):
+        # recompute the block bookkeeping, splitting any big blocks
+        blocks = [p for block in self._blocks for p in self._split(block)]
+        times = [p for t in self._times for p in self._split(t)]
+        for key, flags in self._flags.items():
+            self._flags[key] = [p for f in flags for p in self._split(f)]
+        self._blocks, self._times = blocks, times
+        self._firsts = array.array('d', (t[0] for t in times))
+        self._starts = list(itertools.accumulate(
+            itertools.chain([0], (len(block) for block in blocks[:-1]))))
+        del self._starts[len(blocks):]
+        self._origin = 0
+
+    def append(self, m):
+        '''Add a message, which will usually be the newest one.'''
+        if not self._len or not precedes(m, self._blocks[-1][-1]):
+            self._changed(self._len, self._len, 1)
+            self._extend([m])
+            self._post([m])
+        else:
+            self.insert(m)
+
+    def insert(self, m):
+        '''Add a message where it belongs.'''
+        i = self.span(m)[1]
+        self._post([m])
+        if i == self._len:
+            self._changed(i, i, 1)
+            self._extend([m])
+            return
+        self._changed(i, i, 1)
+        b = self._block(i)
+        offset = i + self._origin - self._starts[b]
+        self._blocks[b].insert(offset, m)
+        self._times[b].insert(offset, m.time)
+        for flags in self._flags.values():
+            flags[b].insert(offset, UNKNOWN[0])
+        if offset == 0:
+            self._firsts[b] = m.time
+        for j in range(b + 1, len(self._starts)):
+            self._starts[j] += 1
+        self._len += 1
+        if len(self._blocks[b]) >= 2 * self.BLOCKSIZE:
+            self._reindex()
+
+    def prepend(self, ms):
+        '''Add a sorted list of messages that are all older than ours.'''
+        if not ms:
+            return
+        if self._len and precedes(self._blocks[0][0], ms[-1]):
+            self.merge(ms)
+            return
+        self._changed(0, 0, len(ms))
+        self._post(ms)
+        if not self._len:
+            self._extend(ms)
+            return
+        if len(self._blocks[0]) + len(ms) <= self.BLOCKSIZE:
+            # top up the first block
+            self._blocks[0][0:0] = ms
+            self._times[0][0:0] = array.array('d', (m.time for m in ms))
+            for flags in self._flags.values():
+                flags[0][0:0] = UNKNOWN * len(ms)
+            self._firsts[0] = ms[0].time
+            self._origin -= len(ms)
+            self._starts[0] = self._origin
+        else:
+            # new blocks, with any short one at the front where the next
+            # prepend can fill it up
+            cut = len(ms) % self.BLOCKSIZE
+            chunks = ([ms[:cut]] if cut else []) + [
+                ms[i:i + self.BLOCKSIZE]
+                for i in range(cut, len(ms), self.BLOCKSIZE)]
+            self._origin -= len(ms)
+            self._blocks[0:0] = chunks
+            self._times[0:0] = [
+                array.array('d', (m.time for m in chunk)) for chunk in chunks]
+            for flags in self._flags.values():
+                flags[0:0] = [
+                    bytearray(UNKNOWN * len(chunk)) for chunk in chunks]
+            self._firsts[0:0] = array.array('d', (c[0].time for c in chunks))
+            self._starts[0:0] = list(itertools.accumulate(itertools.chain(
+                [self._origin], (len(chunk) for chunk in chunks[:-1]))))
+        self._len += len(ms)
+
+    def merge(self, ms):
+        '''Merge in a sorted list of messages.'''
+        if not ms:
+            return
+        if not self._len or not precedes(ms[0], self._blocks[-1][-1]):
+            self._changed(self._len, self._len, len(ms))
+            self._extend(ms)
+            self._post(ms)
+            return
+        if not precedes(self._blocks[0][0], ms[-1]):
+            self.prepend(ms)
+            return
+        self._post(ms)
+        self._changed(
+            self.locate(ms[0].time), self.locate(ms[-1].time, True),
+            len(ms))
+        pending = collections.OrderedDict()
+        for m in ms:
+            b = max(0, bisect.bisect_right(self._firsts, m.time) - 1)
+            while b > 0 and precedes(m, self._blocks[b][0]):
+                b -= 1
+            pending.setdefault(b, []).append(m)
+        for b, new in pending.items():
+            block, times = self._blocks[b], self._times[b]
+            merged = []
+            cuts = [] # where the new messages go, in the old block
+            i = 0
+            for m in new:
+                j = bisect.bisect_right(times, m.time, i)
+                while j > i and precedes(m, block[j - 1]):
+                    j -= 1
+                merged.extend(block[i:j])
+                merged.append(m)
+                cuts.append(j)
+                i = j
+            merged.extend(block[i:])
+            self._blocks[b] = merged
+            self._times[b] = array.array('d', (m.time for m in merged))
+            for flags in self._flags.values():
+                bits, i = bytearray(), 0
+                for j in cuts:
+                    bits += flags[b][i:j]
+                    bits += UNKNOWN
+                    i = j
+                bits += flags[b][i:]
+                flags[b] = bits
+        self._len += len(ms)
+        self._reindex()
+
+
+    def discard(self, n, keep=None):
+        '''Drop the oldest ``n`` messages, except for any that ``keep``
+        (if given) is true for, and return the ones that were dropped.
+
+        Positions remembered from before this can't be brought up to date.
+        '''
+        n = min(n, self._len)
+        if n <= 0:
+            return []
+        old = []
+        while self._blocks and len(old) + len(self._blocks[0]) <= n:
+            old.extend(self._blocks.pop(0))
+            self._times.pop(0)
+            for flags in self._flags.values():
+                flags.pop(0)
+        cut = n - len(old)
+        if cut:
+            old.extend(self._blocks[0][:cut])
+            del self._blocks[0][:cut]
+            del self._times[0][:cut]
+            for flags in self._flags.values():
+                del flags[0][:cut]
+        if keep is None:
+            kept, dropped = [], old
+        else:
+            kept, dropped = [], []
+            for m in old:
+                (kept if keep(m) else dropped).append(m)
+        if kept:
+            self._blocks.insert(0, kept)
+            self._times.insert(0, array.array('d', (m.time for m in kept)))
+            for flags in self._flags.values():
+                flags.insert(0, bytearray(UNKNOWN * len(kept)))
+        self._len -= len(dropped)
+        self._reindex()
+        self.generation += 1
+        self.changes.clear()
+        self._columns = None
+
+        if self.words is not None:
+            self.words.remove(dropped)
+        if self.days is not None:
+            self._count_days(dropped, -1)
+        keptids = set(id(m) for m in kept)
+        for field, index in self.postings.items():
+            counts = collections.Counter(m.field(field) for m in old)
+            for value, count in counts.items():
+                postings = index[value]
+                postings.discard(count, lambda m: id(m) in keptids)
+                if not postings:
+                    del index[value]
+        return dropped
+
+
+class Columns:
+    '''The messages of a :class:`MessageList`, as of one ``generation``,
+    a column at a time, for :meth:`snipe.filters.Filter.mask`.
+
+    ``time`` is an array of the message times.  Each of ``fields`` can
+    be dictionary-encoded (see :meth:`encoded`) the first time a filter
+    asks about it.  Filters work with boolean arrays, a row per message.
+    '''
+
+    # see where()
+    SPARSE = 4
+
+    def __init__(self, messages, times, fields=(), generation=None):
+        self.messages = messages
+        self.time = numpy.array(times, numpy.float64)
+        self.fields = fields
+        self.generation = generation
+        self._seconds = None
+        self._encoded = {}
+
+    def __len__(self):
+        return len(self.messages)
+
+    def rows(self):
+        '''All of the rows.'''
+        return numpy.ones(len(self.messages), bool)
+
+    def none(self):
+        '''None of the rows.'''
+        return numpy.zeros(len(self.messages), bool)
+
+    @property
+    def seconds(self):
+        '''The times as ``m.field('time')`` has them, truncated.'''
+        if self._seconds is None:
+            self._seconds = numpy.trunc(self.time)
+        return self._seconds
+
+    def encoded(self, field, canon=True):
+        '''Return ``(values, codes)``, where ``values`` lists the distinct
+        values of ``field`` and ``codes`` is an array of the index into
+        ``values`` for each message, or ``None`` if ``field`` isn't one of
+        ``fields``.'''
+        if field not in self.fields:
+            return None
+        key = (field, canon)
+        if key not in self._encoded:
+            index = {}
+            codes = numpy.fromiter(
+                (index.setdefault(m.field(field, canon), len(index))
+                 for m in self.messages),
+                numpy.int32, len(self.messages))
+            self._encoded[key] = (list(index), codes)
+        return self._encoded[key]
+
+    def where(self, field, canon, test, rows=None):
+        '''Return the rows where ``test`` is true of the value of ``field``,
+        asking it once per distinct value, or ``None`` if ``field`` isn't
+        one of ``fields``.
+
+        Encoding a field means looking at every message, so if it hasn't
+        been yet and only a few ``rows`` are in question, this returns
+        ``None`` too, and they're better off asked about one at a time.
+        '''
+        if (rows is not None and (field, canon) not in self._encoded
+                and rows.sum() * self.SPARSE < len(rows)):
+            return None
+        encoded = self.encoded(field, canon)
+        if encoded is None:
+            return None
+        values, codes = encoded
+        table = numpy.fromiter(
+            (bool(test(value)) for value in values), bool, len(values))
+        return table[codes]
+
+    def sift(self, rows, predicate):
+        '''Return the ``rows`` for whose messages ``predicate`` is true,
+        asking it about each of them.'''
+        result = self.none()
+        for i in numpy.flatnonzero(rows):
+            result[i] = bool(predicate(self.messages[i]))
+        return result
+
+
+def precedes(a, b):
+    '''Whether message ``a`` sorts before message ``b``.'''
+    return a.time < b.time or (a.time == b.time and a.seq < b.seq)
+
+
+def midnight(date, days=0):
+    '''The time of the local midnight that starts ``date`` (plus ``days``).'''
+    return datetime.datetime.combine(
+        date + datetime.timedelta(days=days), datetime.time()).timestamp()
+
+
+class WordIndex:
+    '''Which messages have which words in their bodies.
+
+    Words are runs of ``\\w`` characters, lowercased.  :meth:`search`
+    uses them to narrow down which messages could contain a string,
+    without looking at every message.
+    '''
+
+    CACHE = 16
+
+    WORD = re.compile(r'\w+')
+
+    # the filter field that corresponds to what we index
+    field = 'body'
+
+    def __init__(self):
+        # word -> messages, in the order they were added
+        self.words = {}
+        # (strings) -> MessageList of messages that contain all of them
+        self.cache = collections.OrderedDict()
+
+    def add(self, ms):
+        '''Add sorted messages to the index.'''
+        for m in ms:
+            for word in set(self.WORD.findall(str(m.body).lower())):
+                postings = self.words.get(word)
+                if postings is None:
+                    self.words[word] = [m]
+                else:
+                    postings.append(m)
+        # bring the remembered searches up to date
+        for strings, result in self.cache.items():
+            found = [m for m in ms if self.contains(m, strings)]
+            if found:
+                result.merge(found)
+
+    def remove(self, ms):
+        '''Forget messages.'''
+        gone = set(id(m) for m in ms)
+        words = set()
+        for m in ms:
+            words.update(self.WORD.findall(str(m.body).lower()))
+        for word in words:
+            postings = [m for m in self.words[word] if id(m) not in gone]
+            if postings:
+                self.words[word] = postings
+            else:
+                del self.words[word]
+        self.cache.clear()
+
+    @staticmethod
+    def contains(m, strings):
+        body = str(m.body).lower()
+        return all(s in body for s in strings)
+
+    def candidates(self, string):
+        '''Return a list of lists of messages that between them include
+        every message that could contain ``string`` (ignoring case), or
+        ``None`` if there's no telling.
+
+        Each word in ``string`` narrows things down separately; this
+        picks the one that narrows it down the most.'''
+        string = string.lower()
+        pieces = self.WORD.split(string)
+        words = self.WORD.findall(string)
+        exact, partial = [], []
+        for i, word in enumerate(words):
+            # a word at either end of the string might be just part of a
+            # longer word in the message
+            prefix = i == 0 and not pieces[0]
+            suffix = i == len(words) - 1 and not pieces[-1]
+            if prefix or suffix:
+                partial.append((word, prefix, suffix))
+            else:
+                exact.append(self.words.get(word, []))
+        if exact:
+            return [min(exact, key=len)]
+        if not partial:
+            return None
+        # one pass over the vocabulary for all of the partial words
+        matches = [[] for p in partial]
+        for w, postings in self.words.items():
+            for n, (word, prefix, suffix) in enumerate(partial):
+                if (word in w if prefix and suffix else
+                        w.endswith(word) if prefix else
+                        w.startswith(word)):
+                    matches[n].append(postings)
+        return min(matches, key=lambda m: sum(len(p) for p in m))
+
+    def search(self, strings):
+        '''Return a ``MessageList`` of the messages that contain all of
+        ``strings`` (ignoring case), or ``None`` if the index can't help.'''
+        strings = tuple(sorted(set(s.lower() for s in strings)))
+        result = self.cache.get(strings)
+        if result is not None:
+            self.cache.move_to_end(strings)
+            return result
+
+        best = None
+        for string in strings:
+            matches = self.candidates(string)
+            if matches is not None and (best is None or (
+                    sum(len(p) for p in matches)
+                    < sum(len(p) for p in best))):
+                best = matches
+        if best is None:
+            return None
+
+        candidates = {
+            id(m): m for m in itertools.chain.from_iterable(best)}
+        result = MessageList(sorted(
+            (m for m in candidates.values() if self.contains(m, strings)),
+            key=lambda m: (m.time, m.seq)))
+        if len(self.cache) >= self.CACHE:
+            self.cache.popitem(last=False)
+        self.cache[strings] = result
+        return result
@@ -35,13 +35,16 @@ UI for looking at messages.
 '''
 
 
+import itertools
 import time
 import datetime
 import traceback
 import pprint
 import asyncio
+import logging
 
 from . import filters
+from . import messagelist
 from . import roost
 from . import keymap
 from . import window
@@ -85,13 +88,6 @@ class Messager(window.Window, window.PagingMixIn):
         for backend in self.context.backends:
             self.keymap.interrogate(backend)
             self.keymap.interrogate(backend.__class__.__module__)
-        self.rules = []
-        for (filt, decor) in self.context.conf.get('rule', []):
-            try:
-                self.rules.append((filters.makefilter(filt), decor))
-            except:
-                self.log.exception(
-                    'error in filter %s for decor %s', filt, decor)
 
     def focus(self):
         if self.secondary is not None:
@@ -117,14 +113,13 @@ class Messager(window.Window, window.PagingMixIn):
             prev = None
             backfill_to = None
 
-        for x in self.walk(
-                origin, direction == 'forward', backfill_to=backfill_to):
+        rules = self.context.rules
+
+        for x in itertools.chain.from_iterable(
+                self.fe.context.backends.walk_batches(
+                    origin, direction == 'forward', self.filter, backfill_to)):
             try:
-                decoration = {}
-                for filt, decor in self.rules:
-                    if filt(x):
-                        decoration.update(decor)
-                chunk = x.display(decoration)
+                chunk = x.display(rules.decorate(x))
             except:
                 chunk = [
                     (('bold',), repr(x) + '\n'),
@@ -180,9 +175,7 @@ class Messager(window.Window, window.PagingMixIn):
             m1, m2 = mrange
             self.log.debug('head=%s, sill=%s', repr(head), repr(sill))
             self.log.debug('m1=%s, m2=%s', repr(m1), repr(m2))
-            self.log.debug('max(head, m1)=%s', repr(max(head, m1)))
-            self.log.debug('min(sill, m2)=%s', repr(min(sill, m2)))
-            if max(head, m1) <= min(sill, m2):
+            if max(head.time, m1.time) <= min(sill.time, m2.time):
                 self.log.debug('True!')
                 return True
         self.log.debug("Fals.e")
@@ -359,7 +352,14 @@ class Messager(window.Window, window.PagingMixIn):
             s = yield from self.read_string(
                 'Filter expression (Control-J when finished):\n', s, 5)
 
-            self.filter_replace(filters.makefilter(s))
+            f = filters.makefilter(s)
+            self.filter_replace(f)
+            if f is not None:
+                # what actually gets run, named filters and all
+                plan = f.simplify({'context': self.context})
+                if isinstance(plan, bool):
+                    plan = filters.Yes() if plan else filters.No()
+                self.context.message('Filtering on: ' + str(plan.optimize()))
         else:
             conf = self.context.conf
             name = yield from self.read_string(
@@ -384,16 +384,7 @@ class Messager(window.Window, window.PagingMixIn):
         self.filter_push_and_replace(filters.No())
 
     def filter_clear_decorate(self, decoration):
-        self.rules = [
-            (filt, decor) for (filt, decor) in self.rules if filt != self.filter]
-        self.rules.append((self.filter, decoration))
-        self.context.conf['rule'] = [
-            (filts, decor)
-            for (filts, decor) in self.context.conf.get('rule', [])
-            if filts != str(self.filter)
-            ]
-        self.context.conf['rule'].append((str(self.filter), decoration))
-        self.context.conf_write()
+        self.context.rules.add(self.filter, decoration)
         self.filter_reset()
 
     @keymap.bind('Meta-/ g')
@@ -527,6 +518,16 @@ class Messager(window.Window, window.PagingMixIn):
              + '\n'
             + pformat(getattr(self.cursor, 'data', None)))
 
+    @keymap.bind('Control-X =')
+    def show_stats(self):
+        """Show how many messages each backend is holding on to, and
+        roughly how much memory they take up."""
+
+        self.show('\n'.join(
+            backend.name + ': ' + ', '.join(
+                '%s %s' % (name, value) for (name, value) in backend.stats())
+            for backend in self.fe.context.backends) + '\n')
+
     def goto_time(self, when):
         self.log.info('going to %s', datetime.datetime.fromtimestamp(when).isoformat(' '))
         old = self.cursor
@@ -534,6 +535,22 @@ class Messager(window.Window, window.PagingMixIn):
         if old != self.cursor:
             self.set_mark(old)
 
+    def goto_date(self, date):
+        # the date header is where the day starts whatever the filter says,
+        # so once the backends have been asked to dig back to it there's
+        # nothing to walk
+        when = messagelist.midnight(date)
+        backends = self.fe.context.backends
+        backends.backfill(None, when)
+        header = backends.dateheader(date)
+        if header is None:
+            return self.goto_time(when)
+        self.log.info('going to %s', date.isoformat())
+        old = self.cursor
+        self.cursor = header
+        if old != self.cursor:
+            self.set_mark(old)
+
     @keymap.bind('Meta-g')
     def goto(self):
         """Go to a specified time, backfilling as appropriate.  Date-time
@@ -553,7 +570,8 @@ class Messager(window.Window, window.PagingMixIn):
     def prev_day(self, count: interactive.integer_argument=1):
         """Jump to the previous midnight, backfilling as appropriate.
 
-        Integer argument specifies multiple days."""
+        Integer argument specifies multiple days.  Days that are known to
+        have no messages don't count."""
 
         if count < 0:
             return self.next_day(-count)
@@ -566,17 +584,17 @@ class Messager(window.Window, window.PagingMixIn):
                 date = when.date()
                 if when.time() == datetime.time(0): #midnight
                     #XXX should check if we're at the first message today
-                    date -= datetime.timedelta(days=1)
-            midnight = datetime.datetime.combine(date, datetime.time())
-            delta = datetime.timedelta(days=count - 1)
-            when = midnight - delta
-            self.goto_time(when.timestamp())
+                    date = self.nextdate(date, False)
+            for i in range(count - 1):
+                date = self.nextdate(date, False)
+            self.goto_date(date)
 
     @keymap.bind('Control-X ]')
     def next_day(self, count: interactive.integer_argument=1):
         """Jump to the next midnight.
 
-        Integer argument specifies multiple days."""
+        Integer argument specifies multiple days.  Days that are known to
+        have no messages don't count."""
 
         if count < 0:
             return self.prev_day(-count)
@@ -586,10 +604,17 @@ class Messager(window.Window, window.PagingMixIn):
                 return
 
             date = datetime.date.fromtimestamp(self.cursor.time)
-            midnight = datetime.datetime.combine(date, datetime.time())
-            delta = datetime.timedelta(days=count)
-            when = midnight + delta
-            self.goto_time(when.timestamp())
+            for i in range(count):
+                date = self.nextdate(date, True)
+            self.goto_date(date)
+
+    def nextdate(self, date, forward):
+        # skip over days we know to be empty; if we don't know of any
+        # messages further along, just go a day and let the backends dig
+        found = self.context.backends.nextdate(date, forward)
+        if found is None:
+            found = date + datetime.timedelta(days=1 if forward else -1)
+        return found
 
     @keymap.bind('Control-[space]')
     def set_mark(self, where=None, prefix: interactive.argument=None):
@@ -625,3 +650,91 @@ class Messager(window.Window, window.PagingMixIn):
         if self.the_mark is not None:
             self.cursor, self.the_mark = self.the_mark, self.cursor
             self.cursor = next(self.walk(self.cursor, True))
+
+
+class Rules:
+    """The decoration rules from the ``rule`` section of the configuration,
+    shared between all of the messager windows.
+
+    The rules' filters are compiled into one function that says which of
+    them a message matches, and the decoration that a message gets is
+    kept on the message until the configuration changes (unless one of
+    the rules is a python filter, which could change its mind).
+    """
+
+    def __init__(self, context):
+        self.context = context
+        self.log = logging.getLogger('Rules')
+        self.generation = None # of the configuration, when we read it
+        self.version = 0 # bumped every time we reread it
+        self.rules = []
+        self.match = None
+        self.combined = {} # which rules matched -> decoration
+        self.cacheable = True # whether decorations can be kept
+
+    def load(self):
+        """Recompile the rules if the configuration has changed."""
+        generation = getattr(self.context, 'conf_generation', None)
+        if generation is not None and generation == self.generation:
+            return
+        self.generation = generation
+        self.version += 1
+        self.rules = []
+        for (filt, decor) in self.context.conf.get('rule', []):
+            try:
+                f = filters.makefilter(filt)
+            except:
+                self.log.exception(
+                    'error in filter %s for decor %s', filt, decor)
+                continue
+            if f is not None:
+                self.rules.append((f, decor))
+        self.combined = {}
+
+        # named filters get expanded now, since we'll be back if they
+        # change; relative times have to keep up with the clock, though
+        tests = []
+        for f, _ in self.rules:
+            f = f.simplify({'context': self.context, 'relative': True})
+            if isinstance(f, bool):
+                f = filters.Yes() if f else filters.No()
+            tests.append(f.optimize())
+        self.cacheable = all(f.cacheable() for f in tests)
+        env = {}
+        try:
+            self.match = eval(
+                'lambda m, state=None: (%s)' % (
+                    ''.join(f.expression(env) + ', ' for f in tests),),
+                env)
+        except (SyntaxError, RuntimeError, MemoryError):
+            self.log.exception('compiling rules')
+            tests = [filters.compiled(f) for f in tests]
+            self.match = lambda m: tuple(bool(f(m)) for f in tests)
+
+    def add(self, filt, decoration):
+        """Decorate messages that match ``filt`` with ``decoration``,
+        instead of however that filter decorated them before."""
+        conf = self.context.conf
+        conf['rule'] = [
+            (filts, decor) for (filts, decor) in conf.get('rule', [])
+            if filts != str(filt)]
+        conf['rule'].append((str(filt), decoration))
+        self.context.conf_write() # which bumps conf_generation
+
+    def decorate(self, m):
+        """Return the decoration for message ``m``."""
+        self.load()
+        cached = m._decoration
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+        matched = self.match(m)
+        decoration = self.combined.get(matched)
+        if decoration is None:
+            decoration = {}
+            for hit, (_, decor) in zip(matched, self.rules):
+                if hit:
+                    decoration.update(decor)
+            self.combined[matched] = decoration
+        if self.cacheable:
+            m._decoration = (self.version, decoration)
+        return decoration
@@ -34,22 +34,25 @@ Utilities and base classes for dealin with messages.
 '''
 
 
+import bisect
 import itertools
 import time
 import datetime
 import logging
 import functools
-import bisect
 import asyncio
 import math
+import heapq
+import collections
+import sys
 
 from . import util
 from . import filters
+from . import messagelist
 
 
 class SnipeAddress:
-    backend = None
-    path = []
+    __slots__ = ('backend', 'path')
 
     def __init__(self, backend, path=[]):
         self.backend = backend
@@ -78,18 +81,30 @@ class SnipeAddress:
 
 @functools.total_ordering
 class SnipeMessage:
-    personal = False
-    outgoing = False
-    noise = False
-    omega = False
-    error = False
+    # there are a lot of these, so no __dict__; subclasses need their own
+    # __slots__ too
+    __slots__ = (
+        'backend', 'time', 'seq', 'body', 'data', '_sender', '_fields',
+        'personal', 'outgoing', 'noise', 'omega', 'error', '_decoration',
+        )
 
     def __init__(self, backend, body='', mtime=None):
         self._sender = None
+        self._fields = None
+        # (Rules.version, decoration); see snipe.messager.Rules
+        self._decoration = None
         self.backend = backend
         self.time = time.time() if mtime is None else mtime
+        # breaks ties between messages at the same time; backends that can
+        # have those number their messages in the order they belong
+        self.seq = 0
         self.body = body
         self.data = {}
+        self.personal = False
+        self.outgoing = False
+        self.noise = False
+        self.omega = False
+        self.error = False
 
     @property
     def sender(self):
@@ -132,9 +147,22 @@ class SnipeMessage:
         return value
 
     def field(self, name, canon=True):
-        val = getattr(self, name, None)
-        if val is None:
-            val = self.data.get(name, None)
+        # Filters ask for the same handful of fields over and over, so
+        # remember what we worked out.  Messages don't change once
+        # they're ingested (backends order them by (time, seq), so ties
+        # don't move .time either); the time just isn't worth keeping,
+        # since it's already right there and it would cost every message
+        # another dictionary entry.
+        fields = self._fields
+        if fields is None:
+            fields = self._fields = {}
+        else:
+            try:
+                return fields[name, canon]
+            except KeyError:
+                pass
+
+        val = self.lookup(name)
 
         if hasattr(val, '__int__'):
             val = int(val)
@@ -145,10 +173,23 @@ class SnipeMessage:
             val = self.canon(name, val)
         if val is None:
             val = ''
+        if name != 'time':
+            fields[name, canon] = val
+        return val
+
+    def lookup(self, name):
+        """The raw value of field ``name``, for ``field`` to tidy up."""
+        val = getattr(self, name, None)
+        if val is None:
+            val = self.data.get(name, None)
         return val
 
     def _coerce(self, other):
-        if hasattr(other, 'time'):
+        if isinstance(other, SnipeMessage):
+            return other.time
+        elif isinstance(other, (float, int)):
+            return other
+        elif hasattr(other, 'time'):
             return other.time
         elif hasattr(other, '__float__'):
             return float(other)
@@ -158,9 +199,13 @@ class SnipeMessage:
             return other # probably will fail :-)
 
     def __eq__(self, other):
+        if isinstance(other, SnipeMessage):
+            return self.time == other.time and self.seq == other.seq
         return self.time == self._coerce(other)
 
     def __lt__(self, other):
+        if isinstance(other, SnipeMessage):
+            return (self.time, self.seq) < (other.time, other.seq)
         return self.time < self._coerce(other)
 
     def reply(self):
@@ -184,23 +229,43 @@ class SnipeMessage:
         return hash(self.time)
 
     def __float__(self):
-        return self.time
+        return float(self.time)
 
 
 class SnipeBackend:
     # name of concrete backend
     name = None
-    # list of messages, sorted by message time
+    # messagelist.MessageList of messages, sorted by message time
     #  (not all backends will export this, it can be None)
     messages = []
     principal = None
+    # how many walk starting points to remember
+    STARTCACHE = 256
+    # fields to keep posting lists for (see messagelist.MessageList)
+    indexed_fields = ()
+    # how many messages walk_batches hands out at a time
+    BATCH = 128
+    # how many of the newest messages to keep (0 for all of them), how many
+    # days worth, and a filter for ones to keep regardless; see evict()
+    retain = 0
+    retain_days = 0
+    retain_filter = None
+    # don't bother evicting fewer messages than this at a time, or within
+    # this many seconds of a backfill (the user's probably looking at it)
+    EVICT = 512
+    EVICT_GRACE = 600
 
     def __init__(self, context, conf = {}):
         self.context = context
         self.conf = conf
         self.log = logging.getLogger(
             '%s.%x' % (self.__class__.__name__, id(self),))
-        self.startcache = {}
+        # (start, seq, forward, filter) -> (generation, origin, point)
+        self.startcache = collections.OrderedDict()
+        # the oldest message of the unbroken run of them we have, if
+        # we've evicted anything older, and when we last backfilled
+        self.horizon = None
+        self.backfilled = 0
 
     def walk(self, start, forward=True, mfilter=None, backfill_to=None,
             search=False):
@@ -225,8 +290,27 @@ class SnipeBackend:
         ``search`` lets backends behave differently when not called from the
         redisplay, for data headers and such that want to bypass filters on
         display.
+
+        This is a message-at-a-time wrapper around :meth:`walk_batches`.
+        Plenty of callers only want the first message or so, so it asks
+        for batches that start small.
         """
-        self.log.debug('walk(%s, %s, [filter], %s, %s)',
+        for batch in self.walk_batches(
+                start, forward, mfilter, backfill_to, search, grow=True):
+            yield from batch
+
+    def walk_batches(self, start, forward=True, mfilter=None,
+            backfill_to=None, search=False, size=None, grow=False):
+        """Like :meth:`walk`, but yield the messages in lists of at most
+        ``size`` (by default, ``BATCH``) at a time.
+
+        The filter is applied to a slice of the message list at a time, so
+        the per-message cost of walking is a call to the compiled filter
+        rather than a trip through a stack of generators.  If ``grow``, the
+        slices start out a message long and double up to ``size``, so that
+        getting the first match doesn't mean filtering a whole batch.
+        """
+        self.log.debug('walk_batches(%s, %s, [filter], %s, %s)',
             repr(start), forward, util.timestr(backfill_to), search)
         # I have some concerns that that this depends on the self.messages list
         # being stable over the life of the iterator.  This doesn't seem to be a
@@ -234,6 +318,9 @@ class SnipeBackend:
         # address this at some point.   (If you are finding this comment because
         # of weird message list behavior, this might be why...)
 
+        if size is None:
+            size = self.BATCH
+
         if mfilter is not None:
             mfilter = mfilter.simplify({
                 'backend': self.name,
@@ -245,64 +332,242 @@ class SnipeBackend:
                 mfilter = None
 
         if mfilter is None:
-            mfilter = lambda m: True
+            predicate = lambda m: True
+            earliest, latest = float('-inf'), float('inf')
+        else:
+            predicate = filters.compiled(mfilter)
+            earliest, latest = mfilter.timerange()
+            if earliest > latest:
+                return
 
-        cachekey = (start, forward, mfilter)
-        point = self.startcache.get(cachekey, None)
+        # don't look at, or dig for, anything outside the filter's time range
+        if backfill_to is not None:
+            backfill_to = max(backfill_to, earliest)
+        if forward:
+            if start is None or float(start) < earliest:
+                start = earliest if math.isfinite(earliest) else start
+            limit = latest
+        else:
+            if start is None or float(start) > latest:
+                start = latest if math.isfinite(latest) else start
+            limit = earliest
 
         if backfill_to is not None and math.isfinite(backfill_to):
-            self.backfill(mfilter, backfill_to)
+            self.backfill(predicate, backfill_to)
+
+        plan = None
+        if mfilter is not None and (
+                getattr(self.messages, 'postings', None)
+                or getattr(self.messages, 'words', None) is not None):
+            plan = mfilter.plan(self.messages)
+        if plan is not None:
+            for chunk in self.walk_postings(
+                    plan, start, forward, size, grow):
+                chunk, clipped = clip(chunk, forward, limit)
+                batch = [m for m in chunk if predicate(m)]
+                if batch:
+                    yield batch
+                if clipped:
+                    break
+        else:
+            yield from self.walk_scan(
+                start, forward, mfilter, predicate, limit, size, search, grow)
 
-        if point is False:
+        # specifically catch the situation where we're trying to go off the top
+        if not forward and backfill_to is not None:
+            self.backfill(predicate, backfill_to)
+
+    def walk_postings(self, plan, start, forward, size=None, grow=False):
+        """Iterate through the union of the posting lists in ``plan``, in
+        order, from ``start``, in lists of up to ``size`` messages (see
+        :meth:`walk_batches` for ``grow``)."""
+        if size is None:
+            size = self.BATCH
+        if len(plan) == 1:
+            p = plan[0]
+            for _, chunk in p.slices(
+                    p.seek(start, forward), forward, size, grow):
+                yield chunk
             return
+        iterators = [
+            (m for (_, m) in p.iterate(p.seek(start, forward), forward))
+            for p in plan]
+        yield from batches(self.union(iterators, forward), size, grow)
+
+    def union(self, iterators, forward):
+        # a message can be in several of the lists
+        when, seen = None, set()
+        for m in merge(
+                iterators, (lambda m: (m.time, m.seq)) if forward else
+                (lambda m: (-m.time, -m.seq))):
+            if m.time != when:
+                when, seen = m.time, set()
+            if id(m) not in seen:
+                seen.add(id(m))
+                yield m
 
-        needcache = False
-        if point is None:
-            needcache = True
-            if start is not None:
-                left = bisect.bisect_left(self.messages, start)
-                right = bisect.bisect_right(self.messages, start)
-                try:
-                    point = self.messages.index(start, left, right)
-                except ValueError:
-                    point = None
+    def walk_scan(
+            self, start, forward, mfilter, predicate, limit=None, size=None,
+            search=False, grow=False):
+        """Iterate through the messages that satisfy ``predicate`` (which is
+        ``mfilter`` compiled), in order, from ``start`` until ``limit`` (a
+        time), in lists of up to ``size`` messages (see :meth:`walk_batches`
+        for ``grow``).  A ``search`` is liable to look through all of them,
+        so it has the filter answer for all of them at once, a column at a
+        time, if it can."""
+        if limit is None:
+            limit = float('inf') if forward else float('-inf')
+        # python filters can change their minds, so nothing they say is kept
+        cacheable = mfilter is None or mfilter.cacheable()
+        # a message is == its time, but they don't start in the same place
+        cachekey = (start, getattr(start, 'seq', None), forward, mfilter)
+        generation = self.messages.generation
+        point = None
+        cached = self.startcache.get(cachekey) if cacheable else None
+        if cached is not None:
+            cached = self.messages.revalidate(*cached, forward=forward)
+            if cached is None:
+                del self.startcache[cachekey]
             else:
-                if forward:
-                    point = 0
-                else:
-                    point = len(self.messages) - 1
+                origin, point = cached
+                self.startcache[cachekey] = (generation, origin, point)
 
-            if forward:
-                point = point if point is not None else left
-            else:
-                point = point if point is not None else right - 1
+        needcache = False
+        if point is None:
+            needcache = cacheable
+            point = origin = self.messages.seek(start, forward)
 
-        if forward:
-            getnext = lambda x: x + 1
+        if mfilter is None:
+            slices = (
+                (point, chunk, None) for (point, chunk)
+                in self.messages.slices(
+                    point, forward, size or self.BATCH, grow))
+        elif not cacheable:
+            slices = (
+                (point, chunk, bytes(1 if predicate(m) else 0 for m in chunk))
+                for (point, chunk)
+                in self.messages.slices(
+                    point, forward, size or self.BATCH, grow))
         else:
-            getnext = lambda x: x - 1
-
-        #self.log.debug('len(self.messages)=%d, point=%d', len(self.messages), point)
-
-        while self.messages:
-            #self.log.debug(', point=%d', point)
-            if not 0 <= point < len(self.messages):
-                break
-            m = self.messages[point]
-            if mfilter(m):
-                if needcache:
-                    self.startcache[cachekey] = point
+            # the filter's answers are kept with the messages, so the next
+            # walk over them (say, a redisplay) needn't ask it again; what
+            # a named filter means can change with the configuration
+            slices = self.messages.sift(
+                point, forward, predicate,
+                (mfilter, getattr(self.context, 'conf_generation', None)),
+                size or self.BATCH,
+                functools.partial(self.mask, mfilter) if search else None,
+                grow)
+        for point, chunk, flags in slices:
+            chunk, clipped = clip(chunk, forward, limit)
+            if mfilter is None:
+                batch = chunk
+            else:
+                flags = flags[:len(chunk)]
+                batch = list(itertools.compress(chunk, flags))
+            if batch:
+                if needcache and generation == self.messages.generation:
+                    first = 0 if flags is None else flags.index(1)
+                    if len(self.startcache) >= self.STARTCACHE:
+                        self.startcache.popitem(last=False)
+                    self.startcache[cachekey] = (
+                        generation, origin,
+                        point + first if forward else point - first)
                     needcache = False
-                yield m
-            point = getnext(point)
-
-        # specifically catch the situation where we're trying to go off the top
-        if point < 0 and backfill_to is not None:
-            self.backfill(mfilter, backfill_to)
+                yield batch
+            if clipped:
+                break
 
     def backfill(self, mfilter, target=None):
         pass
 
+    def evict(self):
+        """Forget messages that are older than the retention settings
+        allow, except for ones that match ``retain_filter``, and return
+        them.
+
+        Backends that can backfill should pick up again from ``horizon``.
+        """
+        messages = self.messages
+        if not (self.retain or self.retain_days) \
+                or not hasattr(messages, 'discard'):
+            return []
+        start = 0 if self.horizon is None else messages.index(self.horizon)
+        n = 0
+        if self.retain:
+            n = len(messages) - start - self.retain
+        if self.retain_days:
+            n = max(n, messages.locate(
+                time.time() - self.retain_days * 24 * 3600) - start)
+        # leave at least one message to backfill from
+        n = min(n, len(messages) - start - 1)
+        if n < self.EVICT or time.time() < self.backfilled + self.EVICT_GRACE:
+            return []
+
+        keep = None
+        if self.retain_filter:
+            keep = filters.makefilter(self.retain_filter).simplify({
+                'backend': self.name,
+                'context': self.context,
+                })
+            if isinstance(keep, bool):
+                keep = filters.Yes() if keep else filters.No()
+            keep = filters.compiled(keep)
+        dropped = messages.discard(start + n, keep)
+        self.horizon = messages[start + n - len(dropped)]
+        self.startcache.clear()
+        self.log.info(
+            'evicted %d messages, keeping %d from %s',
+            len(dropped), len(messages), util.timestr(self.horizon.time))
+        return dropped
+
+    def nextdate(self, date, forward=True):
+        """Return the nearest date after (or before, if not ``forward``)
+        ``date`` that has any messages, if the messages keep track, or
+        ``None``.
+
+        Before ``horizon`` there's only what :meth:`evict` kept, so those
+        days don't count.
+        """
+        messages = self.messages
+        if getattr(messages, 'days', None) is None:
+            return None
+        if self.horizon is None:
+            return messages.nextdate(date, forward)
+        first = datetime.date.fromtimestamp(self.horizon.time)
+        if forward:
+            return messages.nextdate(
+                max(date, first - datetime.timedelta(days=1)))
+        found = messages.nextdate(date, False)
+        if found is None or found < first:
+            return None
+        return found
+
+    def known(self, m):
+        """Return the message we already have that's the same as ``m``
+        (say, one that ``evict`` kept that's being backfilled again), or
+        ``None``."""
+        lo, hi = self.messages.span(m.time)
+        for other in self.messages[lo:hi]:
+            if other.data == m.data:
+                return other
+        return None
+
+    def stats(self):
+        """Return a list of ``(name, value)`` pairs about what this
+        backend is holding on to."""
+        messages = self.messages
+        n = len(messages) if messages is not None else 0
+        sample = [messages[i * n // 100] for i in range(min(n, 100))]
+        return [
+            ('messages', n),
+            ('since', util.timestr(messages[0].time) if n else '-'),
+            ('unbroken since', util.timestr(
+                (self.horizon or messages[0]).time) if n else '-'),
+            ('bytes (roughly)', n * sum(
+                footprint(m) for m in sample) // max(len(sample), 1)),
+            ]
+
     def shutdown(self):
         pass
 
@@ -312,8 +577,27 @@ class SnipeBackend:
     def __str__(self):
         return self.name
 
-    def count(self):
-        """Return the number of messages stored (locally) in this backend."""
+    def mask(self, mfilter, columns):
+        """Return a boolean array of which of the messages in ``columns``
+        match ``mfilter``, if it can say without asking about them one at
+        a time, otherwise ``None``."""
+        mfilter = mfilter.simplify({
+            'backend': self.name,
+            'context': self.context,
+            })
+        if isinstance(mfilter, bool):
+            return columns.rows() if mfilter else columns.none()
+        if not mfilter.vectorized(columns):
+            return None
+        return mfilter.mask(columns, columns.rows())
+
+    def count(self, mfilter=None):
+        """Return the number of messages stored (locally) in this backend,
+        or the number of them that match ``mfilter``."""
+        if mfilter is not None:
+            return sum(
+                len(batch) for batch in self.walk_batches(
+                    None, True, mfilter, search=True))
         if self.messages is not None:
             return len(self.messages)
         else:
@@ -321,6 +605,8 @@ class SnipeBackend:
 
 
 class InfoMessage(SnipeMessage):
+    __slots__ = ()
+
     def __str__(self):
         return self.body
 
@@ -336,14 +622,21 @@ class TerminusBackend(SnipeBackend):
         super().__init__(*args, **kw)
         m = InfoMessage(self, '*', mtime=float('inf'))
         m.omega = True
-        self.messages = [m]
+        self.messages = messagelist.MessageList([m])
 
-    def walk(self, start, forward=True, mfilter=None, backfill_to=None,
-            search=False):
-        self.log.debug('walk(..., search=%s)', search)
+    def walk_batches(self, start, forward=True, mfilter=None,
+            backfill_to=None, search=False, size=None, grow=False):
+        self.log.debug('walk_batches(..., search=%s)', search)
         if search:
             return
-        yield from super().walk(start, forward, None, backfill_to, search)
+        yield from super().walk_batches(
+            start, forward, None, backfill_to, search, size, grow)
+
+    def count(self, mfilter=None):
+        # searches never find the end
+        if mfilter is not None:
+            return 0
+        return super().count()
 
 
 class StartupBackend(SnipeBackend):
@@ -351,9 +644,9 @@ class StartupBackend(SnipeBackend):
 
     def __init__(self, *args, **kw):
         super().__init__(*args, **kw)
-        self.messages = [
+        self.messages = messagelist.MessageList([
             SnipeMessage(self, util.SPLASH + '\n'),
-            ]
+            ])
 
 
 class DateBackend(SnipeBackend):
@@ -364,6 +657,27 @@ class DateBackend(SnipeBackend):
         super().__init__(*args, **kw)
         self.messages = None
         self.start = datetime.datetime.now()
+        self.headers = {} # date -> InfoMessage
+
+    def header(self, t):
+        date = t.date()
+        m = self.headers.get(date)
+        if m is None:
+            m = self.headers[date] = InfoMessage(
+                self,
+                t.strftime('%A, %B %d, %Y\n\n'),
+                t.timestamp(),
+                )
+        return m
+
+    def dateheader(self, date):
+        """Return the header that a walk would show at the start of
+        ``date``, or ``None`` if it's outside what's been backfilled (or in
+        the future)."""
+        t = datetime.datetime.combine(date, datetime.time())
+        if not datetime.datetime.now() > t >= self.start:
+            return None
+        return self.header(t)
 
     def backfill(self, mfilter, backfill_to):
         if backfill_to is not None and not math.isinf(float(backfill_to)):
@@ -372,9 +686,14 @@ class DateBackend(SnipeBackend):
                 self.start,
                 datetime.datetime.fromtimestamp(backfill_to))
 
-    def walk(self, start, forward=True, mfilter=None, backfill_to=None,
-            search=False):
+    def walk_batches(self, start, forward=True, mfilter=None,
+            backfill_to=None, search=False, size=None, grow=False):
         # Note that this ignores mfilter
+        yield from batches(
+            self.headers_from(start, forward, mfilter, backfill_to, search),
+            size or self.BATCH, grow)
+
+    def headers_from(self, start, forward, mfilter, backfill_to, search):
         self.log.debug('walk(%s, %s, [filter], %s, %s)',
             repr(start), forward, util.timestr(backfill_to), search)
 
@@ -421,12 +740,7 @@ class DateBackend(SnipeBackend):
         self.log.debug('t = %s, delta = %s', util.timestr(t.timestamp()), repr(delta))
 
         while now > t >= self.start:
-            self.log.debug('date header at %s', util.timestr(t.timestamp()))
-            yield InfoMessage(
-                self,
-                t.strftime('%A, %B %d, %Y\n\n'),
-                t.timestamp(),
-                )
+            yield self.header(t)
             t += delta
 
         self.log.debug('leaving walk')
@@ -443,7 +757,7 @@ class SyntheticBackend(SnipeBackend):
         self.name = '%s-%d-%s-%d' % (
             self.name, self.count, self.string, self.width)
         now = int(time.time())
-        self.messages = [
+        self.messages = messagelist.MessageList(
             SnipeMessage(
                 self,
                 ''.join(itertools.islice(
@@ -451,27 +765,145 @@ class SyntheticBackend(SnipeBackend):
                     i,
                     i + self.width)),
                 now - self.count + i)
-            for i in range(self.count)]
+            for i in range(self.count))
 
 
-def merge(iterables, key=lambda x: x):
-    # get the first item from all the iterables
-    d = {}
+def footprint(m):
+    """Roughly how many bytes of memory ``m`` takes up."""
+    size = sys.getsizeof(m) + sys.getsizeof(m.body) + sys.getsizeof(m.data)
+    size += sum(sys.getsizeof(v) for v in m.data.values())
+    if m._fields is not None:
+        size += sys.getsizeof(m._fields)
+    return size
+
 
-    for it in iterables:
+def merge(iterables, key=lambda x: x):
+    """Merge already-sorted iterables into one sorted iterator.
+
+    Uses a heap, so each step costs O(log k) in the number of iterables,
+    rather than a scan of all of them.  Ties go to the iterable that
+    appears first in ``iterables``.
+    """
+    heap = []
+    for n, it in enumerate(iterables):
         it = iter(it)
         try:
-            d[it] = next(it)
+            v = next(it)
         except StopIteration:
-            pass
+            continue
+        heap.append((key(v), n, v, it))
 
-    while d:
-        it, v = min(d.items(), key=lambda x: key(x[1]))
+    if len(heap) == 1:
+        # nothing to merge with
+        _, _, v, it = heap[0]
+        yield v
+        yield from it
+        return
+
+    heapq.heapify(heap)
+
+    while heap:
+        _, n, v, it = heap[0]
+        yield v
         try:
-            d[it] = next(it)
+            v = next(it)
         except StopIteration:
-            del d[it]
-        yield v
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (key(v), n, v, it))
+
+
+def merge_batches(iterables, key=lambda x: x, size=None, grow=False):
+    """Merge iterables of already-sorted lists into one sorted iterator
+    of lists of at most ``size`` (by default, ``SnipeBackend.BATCH``).  If
+    ``grow``, the first list is of (at most) one, and they double from
+    there, up to ``size``.
+
+    The same as flattening the results of :func:`merge` (ties go to the
+    iterable that appears first in ``iterables``) and cutting it up again,
+    but rather than going through a heap a message at a time, everything up
+    to the end of the earliest-ending list at hand goes out in one sort.
+    """
+    if size is None:
+        size = SnipeBackend.BATCH
+    want = 1 if grow else size
+
+    def fill(state):
+        # [list, keys of list, iterator]; False when the iterator runs out
+        for batch in state[2]:
+            if batch:
+                state[0], state[1] = batch, [key(m) for m in batch]
+                return True
+        return False
+
+    live = [[None, None, iter(it)] for it in iterables]
+    live = [state for state in live if fill(state)]
+
+    out = []
+    while len(live) > 1:
+        # Nothing still to come can sort before the horizon.  The first
+        # list to end there is used up; lists before it can also give up
+        # their messages that tie with it, lists after it can't (yet).
+        horizon, h = min(
+            (state[1][-1], n) for (n, state) in enumerate(live))
+        ms, ks = [], []
+        for n, state in enumerate(live):
+            batch, keys, _ = state
+            cut = (bisect.bisect_right if n <= h else bisect.bisect_left)(
+                keys, horizon)
+            ms.extend(batch[:cut])
+            ks.extend(keys[:cut])
+            state[0], state[1] = batch[cut:], keys[cut:]
+        out.extend(ms[i] for i in sorted(range(len(ks)), key=ks.__getitem__))
+        while len(out) >= want:
+            yield out[:want]
+            out = out[want:]
+            want = min(want * 2, size)
+        live = [state for state in live if state[0] or fill(state)]
+
+    if live:
+        # nothing (left) to merge with
+        batch, _, it = live[0]
+        out.extend(batch)
+        while len(out) >= want:
+            yield out[:want]
+            out = out[want:]
+            want = min(want * 2, size)
+        if out:
+            yield out
+        for batch in it:
+            if batch:
+                yield batch
+    elif out:
+        yield out
+
+
+def batches(iterable, size, grow=False):
+    """Cut ``iterable`` up into lists of (at most) ``size``, or if
+    ``grow``, of one, then two, and so on up to ``size``."""
+    it = iter(iterable)
+    n = 1 if grow else size
+    while True:
+        batch = list(itertools.islice(it, n))
+        if not batch:
+            return
+        yield batch
+        n = min(n * 2, size)
+
+
+def clip(chunk, forward, limit):
+    """Split off the end of the sorted list ``chunk`` that is past the time
+    ``limit`` in the direction of travel; return what's left and whether
+    anything was removed."""
+    if not chunk or (
+            chunk[-1].time <= limit if forward else chunk[-1].time >= limit):
+        return chunk, False
+    n = len(chunk)
+    while n and (
+            chunk[n - 1].time > limit if forward
+            else chunk[n - 1].time < limit):
+        n -= 1
+    return chunk[:n], True
 
 
 def logiter(log, x):
@@ -485,6 +917,11 @@ class AggregatorBackend(SnipeBackend):
     # no reason that it shouldn't expose the same API for now
     messages = None
     loglevel = util.Level('log.aggregator', 'AggregatorBackend')
+    trace = util.Configurable(
+        'aggregator.trace', False,
+        'log every message that comes out of the aggregator'
+        ' (very slow, needs log.aggregator at DEBUG)',
+        coerce=util.coerce_bool)
 
     def __init__(self, context, backends = [], conf = {}):
         super().__init__(context, conf)
@@ -497,8 +934,17 @@ class AggregatorBackend(SnipeBackend):
 
     def walk(self, start, forward=True, filter=None, backfill_to=None,
             search=False):
+        it = itertools.chain.from_iterable(self.walk_batches(
+            start, forward, filter, backfill_to, search, grow=True))
+        if self.trace:
+            it = logiter(self.log, it)
+        return it
+
+    def walk_batches(self, start, forward=True, filter=None,
+            backfill_to=None, search=False, size=None, grow=False):
         self.log.debug(
-            'walk(%s, forward=%s, [filter], backfill_to=%s, search=%s',
+            'walk_batches(%s, forward=%s, [filter], backfill_to=%s,'
+            ' search=%s)',
             repr(start), forward, util.timestr(backfill_to), search)
         # what happends when someone calls .add for an
         # in-progress iteration?
@@ -508,24 +954,48 @@ class AggregatorBackend(SnipeBackend):
         else:
             startbackend = None
             when = start
-        return logiter(self.log, merge(
+        return merge_batches(
             [
-                backend.walk(
+                backend.walk_batches(
                     start if backend is startbackend else when,
                     forward,
                     filter,
                     backfill_to,
                     search,
+                    size,
+                    grow,
                     )
                 for backend in self.backends
                 ],
-            key = lambda m: m.time if forward else -m.time))
+            key = lambda m: m.time if forward else -m.time,
+            size = size,
+            grow = grow)
 
     def shutdown(self):
         for backend in self.backends:
             backend.shutdown()
         super().shutdown()
 
+    def nextdate(self, date, forward=True):
+        """Return the nearest date after (or before, if not ``forward``)
+        ``date`` on which any backend that keeps track has messages, or
+        ``None``."""
+        dates = [backend.nextdate(date, forward) for backend in self.backends]
+        dates = [d for d in dates if d is not None]
+        if not dates:
+            return None
+        return min(dates) if forward else max(dates)
+
+    def dateheader(self, date):
+        """Return the header that a walk would show at the start of
+        ``date``, if any backend has one, or ``None``."""
+        for backend in self.backends:
+            if isinstance(backend, DateBackend):
+                m = backend.dateheader(date)
+                if m is not None:
+                    return m
+        return None
+
     def __iter__(self):
         return iter(self.backends)
 
@@ -542,5 +1012,5 @@ class AggregatorBackend(SnipeBackend):
         for backend in self:
             backend.backfill(filter, target)
 
-    def count(self):
-        return sum(backend.count() for backend in self.backends)
+    def count(self, mfilter=None):
+        return sum(backend.count(mfilter) for backend in self.backends)
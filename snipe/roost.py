@@ -47,9 +47,13 @@ import pwd
 import math
 import getopt
 import traceback
+import sys
+import sqlite3
 
 from . import messages
+from . import messagelist
 from . import _rooster
+from . import _store
 from . import util
 from . import filters
 from . import keymap
@@ -58,6 +62,7 @@ from . import interactive
 
 class Roost(messages.SnipeBackend):
     name = 'roost'
+    indexed_fields = ('class', 'instance', 'sender', 'recipient', 'personal')
 
     backfill_count = util.Configurable(
         'roost.backfill_count', 8,
@@ -85,17 +90,52 @@ class Roost(messages.SnipeBackend):
         'roost.barnowl_indent_body_string', '',
         'Indent message bodies with this string (barnowl expats may '
         'wish to set it to eight spaces)')
+    retain = util.Configurable(
+        'roost.retain', 0,
+        'keep only this many of the newest messages in memory (0 for no'
+        ' limit); older ones are backfilled again if you go looking',
+        coerce=int)
+    retain_days = util.Configurable(
+        'roost.retain_days', 0,
+        'keep only this many days of messages in memory (0 for no limit)',
+        coerce=int)
+    retain_filter = util.Configurable(
+        'roost.retain_filter', 'personal',
+        'keep messages that match this filter in memory regardless',
+        validate=filters.validatefilter)
+    store = util.Configurable(
+        'roost.store', True,
+        'keep a copy of messages on disk, so that starting up needn\'t'
+        ' wait on the server',
+        coerce=util.coerce_bool)
 
     def __init__(self, *args, **kw):
         super().__init__(*args, **kw)
-        self.messages = []
+        self.messages = messagelist.MessageList(
+            indexed=self.indexed_fields, words=True, days=True)
         self.r = _rooster.Rooster(self.url, self.service_name)
         self.chunksize = 128
         self.loaded = False
         self.backfilling = False
+        self.backfillers = []
+        # new messages that can't be stored until we've stored everything
+        # between them and what was stored before
+        self.unstored = None
+        self.db = self.open_store() if self.store else None
+        low, high = (None, None) if self.db is None else self.db.seqs()
+        # numbers for breaking ties between messages at the same time:
+        # counting up for new ones, down for backfilled ones, carrying on
+        # from the ones on disk
+        self.newer = itertools.count((high or 0) + 1)
+        self.older = itertools.count((low or 0) - 1, -1)
+        if high is not None:
+            stored = self.restore(self.db.newest(self.chunksize))
+            self.messages.merge(stored)
+            self.unstored = []
+            self.backfillers.append(asyncio.async(self.error_message(
+                'catching up', self.fill_gap, stored[-1])))
         self.new_task = asyncio.async(self.error_message(
             'getting new messages', self.r.newmessages, self.new_message))
-        self.backfillers = []
 
     @asyncio.coroutine
     def error_message(self, activity, func, *args):
@@ -107,8 +147,8 @@ class Roost(messages.SnipeBackend):
         except Exception as e:
             self.log.exception(activity)
             msg = RoostErrorMessage(self, activity, e, traceback.format_exc())
+            msg.seq = next(self.newer)
             self.messages.append(msg)
-            self.startcache = {}
             self.redisplay(msg, msg)
 
     def shutdown(self):
@@ -117,8 +157,101 @@ class Roost(messages.SnipeBackend):
             # this is kludgy, but make sure the task runs a tick to
             # process its cancellation
             asyncio.get_event_loop().run_until_complete(t)
+        if self.db is not None:
+            self.db.close()
+        self.r.close()
         super().shutdown()
 
+    def stats(self):
+        return super().stats() + self.r.stats()
+
+    def open_store(self):
+        try:
+            self.context.ensure_directory()
+            return _store.MessageStore(
+                os.path.join(self.context.directory, 'roost.db'))
+        except (OSError, sqlite3.Error):
+            self.log.exception('opening the message store')
+            return None
+
+    def restore(self, rows):
+        """Make messages of what came out of the store."""
+        ms = []
+        for seq, data in rows:
+            msg = RoostMessage(self, data)
+            msg.seq = seq
+            ms.append(msg)
+        return ms
+
+    def stash(self, ms):
+        """Put messages in the store."""
+        if self.db is None:
+            return
+        try:
+            self.db.add(
+                (m.get('id'), m.time, m.seq, m.payload()) for m in ms)
+        except sqlite3.Error:
+            self.log.exception('storing messages')
+
+    @asyncio.coroutine
+    def fill_gap(self, last):
+        """Fetch what came in between ``last``, the newest stored message,
+        and the first new one."""
+        lastid = last.get('id')
+        ms = []
+        try:
+            # the messages restored so far couldn't tell which were ours
+            yield from self.r.ensure_auth()
+            self.recognize_own()
+            gap = []
+            start = None
+            while True:
+                chunk = yield from self.r.messages(start, self.chunksize)
+                ids = [m['id'] for m in chunk['messages']]
+                if lastid in ids:
+                    gap.extend(chunk['messages'][:ids.index(lastid)])
+                    break
+                gap.extend(chunk['messages'])
+                if chunk['isDone'] or not gap or (
+                        gap[-1]['receiveTime'] / 1000
+                        < time.time() - self.backfill_length):
+                    # too far behind to bother; start the store over
+                    self.log.warning(
+                        'not catching up from %s', util.timestr(last.time))
+                    self.messages.discard(self.messages.span(last)[1])
+                    self.horizon = None
+                    self.loaded = False
+                    self.db.clear()
+                    break
+                start = ids[-1]
+            gap.reverse()
+            caught = [RoostMessage(self, m) for m in gap]
+            # the new ones might have overlapped
+            caught = [m for m in caught if self.known(m) is None]
+            for m in caught:
+                m.seq = next(self.newer)
+            self.messages.merge(caught)
+            ms = caught
+        finally:
+            # whatever happened, stop holding new messages back
+            self.stash(ms + self.unstored)
+            self.unstored = None
+        self.log.info('caught up %d messages', len(ms))
+        if ms:
+            self.redisplay(ms[0], ms[-1])
+
+    def recognize_own(self):
+        """Once we know who we are, sort out which of the messages we
+        already have are outgoing."""
+        changed = [
+            m for m in self.messages
+            if isinstance(m, RoostMessage) and m.recognize()]
+        if changed:
+            # filters and decorations may have had them wrong
+            self.messages.forget()
+            self.startcache.clear()
+            self.redisplay(changed[0], changed[-1])
+
     @property
     def principal(self):
         return self.r.principal
@@ -156,11 +289,21 @@ class Roost(messages.SnipeBackend):
     @asyncio.coroutine
     def new_message(self, m):
         msg = RoostMessage(self, m)
-        if self.messages and msg.time <= self.messages[-1].time:
-            msg.time = self.messages[-1].time + .00001
+        msg.seq = next(self.newer)
         self.messages.append(msg)
-        self.startcache = {}
+        if self.unstored is None:
+            self.stash([msg])
+        else:
+            self.unstored.append(msg)
         self.redisplay(msg, msg)
+        self.evict()
+
+    def evict(self):
+        dropped = super().evict()
+        if dropped:
+            # there's more to be had from the server now
+            self.loaded = False
+        return dropped
 
     def backfill(self, mfilter, target=None, count=0, origin=None):
         self.log.debug(
@@ -171,7 +314,10 @@ class Roost(messages.SnipeBackend):
         if self.loaded or self.new_task.done() or target is None:
             return
 
-        filledpoint = self.messages[0].time if self.messages else time.time()
+        oldest = self.horizon
+        if oldest is None and self.messages:
+            oldest = self.messages[0]
+        filledpoint = oldest.time if oldest is not None else time.time()
 
         if filledpoint < target:
             self.log.debug('%s < %s', util.timestr(filledpoint), util.timestr(target))
@@ -182,8 +328,8 @@ class Roost(messages.SnipeBackend):
         self.log.debug('triggering backfill, target=%s', util.timestr(target))
 
         msgid = None
-        if self.messages:
-            msgid = self.messages[0].data.get('id')
+        if oldest is not None:
+            msgid = oldest.get('id')
             if origin is None:
                 origin = filledpoint
 
@@ -219,29 +365,51 @@ class Roost(messages.SnipeBackend):
             if mfilter is None:
                 mfilter = lambda m: True
 
-            if self.loaded:
+            oldest = self.horizon
+            if oldest is None and self.messages:
+                oldest = self.messages[0]
+            ms = []
+            if self.db is not None and oldest is not None:
+                ms = self.restore(
+                    self.db.older(oldest.time, oldest.seq, self.chunksize))
+                if not ms and self.db['complete']:
+                    self.loaded = True
+
+            if ms:
+                self.log.debug('backfilling from the store')
+            elif self.loaded:
                 self.log.debug('no more messages to backfill')
                 return
-            self.log.debug('backfilling')
-            chunk = yield from self.r.messages(start, self.chunksize)
-
-            if chunk['isDone']:
-                self.log.info('IT IS DONE.')
-                self.loaded = True
-            ms = [RoostMessage(self, m) for m in chunk['messages']]
+            else:
+                self.log.debug('backfilling')
+                self.backfilled = time.time()
+                chunk = yield from self.r.messages(start, self.chunksize)
+
+                if chunk['isDone']:
+                    self.log.info('IT IS DONE.')
+                    self.loaded = True
+                ms = [RoostMessage(self, m) for m in chunk['messages']]
+                # walking backwards through time, so messages that share a
+                # millisecond sort in the order the server gave them to us
+                for m in ms:
+                    m.seq = next(self.older)
+                ms.reverse()
+                self.stash(ms)
+                if self.loaded and self.db is not None:
+                    self.db['complete'] = '1'
             count += len([m for m in ms if mfilter(m)])
-            # Make sure ordering is stable
-            # XXX really assuming messages are millisecond unique si dumb
-            anchor = []
-            if self.messages:
-                anchor = [(self.messages[0], ms[0])]
-            for (nextmsg, prevmsg) in itertools.chain(anchor, zip(ms, ms[1:])):
-                # walking backwards through time
-                if nextmsg.time == prevmsg.time:
-                    prevmsg.time = nextmsg.time - .00001
-            ms.reverse()
-            self.messages = ms + self.messages
-            self.startcache = {}
+            if self.horizon is not None:
+                # behind what we evicted, we kept some of these already;
+                # pick up from the oldest of them next time.  (The ones we
+                # kept keep their seqs, so another message from the same
+                # millisecond might end up on the wrong side of one.)
+                have = [self.known(m) for m in ms]
+                if ms:
+                    self.horizon = have[0] or ms[0]
+                ms = [m for (m, old) in zip(ms, have) if old is None]
+            if self.loaded:
+                self.horizon = None
+            self.messages.prepend(ms)
             self.log.warning(
                 '%d messages, total %d, earliest %s',
                  count, len(self.messages), util.timestr(self.messages[0].time))
@@ -250,7 +418,8 @@ class Roost(messages.SnipeBackend):
             yield from asyncio.sleep(.1)
             self.backfill(mfilter, target, count=count, origin=origin)
 
-            self.redisplay(ms[0], ms[-1])
+            if ms:
+                self.redisplay(ms[0], ms[-1])
             self.log.debug('done backfilling')
 
     @keymap.bind('R S')
@@ -308,14 +477,59 @@ class Roost(messages.SnipeBackend):
 
 
 class RoostMessage(messages.SnipeMessage):
+    # Most of what gets backfilled is never looked at, so ``sender`` is
+    # worked out the first time someone asks.
+    __slots__ = ()
+
+    # values that repeat a lot from message to message
+    interned = ('class', 'instance', 'recipient', 'opcode', 'sender', 'realm')
+
     def __init__(self, backend, m):
         super().__init__(backend, m['message'], m['receiveTime'] / 1000)
-        self.data = m
-        self._sender = RoostPrincipal(backend, m['sender'])
+        # json.loads gives every message its own copies of the keys (and
+        # of the class, instance, &c), and the body is kept in self.body
+        data = {}
+        for key, value in m.items():
+            if key == 'message':
+                continue
+            if key in self.interned and isinstance(value, str):
+                value = sys.intern(value)
+            data[sys.intern(key)] = value
+        self.data = data
+
+        self.personal = data['recipient'] and data['recipient'][0] != '@'
+        # (messages restored before roost has told us who we are get
+        # another look from Roost.recognize_own)
+        self.outgoing = data['sender'] == self.backend.r.principal
+
+    def recognize(self):
+        """Work out ``outgoing`` again, returning whether it changed."""
+        outgoing = self.data['sender'] == self.backend.r.principal
+        if outgoing == self.outgoing:
+            return False
+        self.outgoing = outgoing
+        self._fields = None
+        self._decoration = None
+        return True
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def payload(self):
+        """The message as roost sent it."""
+        return dict(self.data, message=self.body)
+
+    @property
+    def sender(self):
+        if self._sender is None:
+            self._sender = RoostPrincipal(self.backend, self.data['sender'])
+        return self._sender
 
-        self.personal = self.data['recipient'] \
-          and self.data['recipient'][0] != '@'
-        self.outgoing = self.data['sender'] == self.backend.r.principal
+    def lookup(self, name):
+        # the fields that get indexed and filtered on all the time
+        if name in self.interned:
+            return self.data.get(name)
+        return super().lookup(name)
 
     def __str__(self):
         return (
@@ -484,6 +698,8 @@ class RoostMessage(messages.SnipeMessage):
 
 
 class RoostErrorMessage(messages.SnipeMessage):
+    __slots__ = ()
+
     def __init__(self, backend, activity, exception, tracebackstr):
         body = '%s: %s' % (activity, str(exception))
         if not isinstance(exception, _rooster.RoosterException):
@@ -504,6 +720,8 @@ class RoostErrorMessage(messages.SnipeMessage):
 
 
 class RoostPrincipal(messages.SnipeAddress):
+    __slots__ = ('principal',)
+
     def __init__(self, backend, principal):
         self.principal = principal
         super().__init__(backend, [principal])
@@ -522,6 +740,8 @@ class RoostPrincipal(messages.SnipeAddress):
 
 
 class RoostTriplet(messages.SnipeAddress):
+    __slots__ = ('class_', 'instance', 'recipient')
+
     def __init__(self, backend, class_, instance, recipient):
         self.class_ = class_
         self.instance = instance
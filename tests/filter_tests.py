@@ -36,10 +36,13 @@ Unit tests for various filter-related things
 
 import unittest
 import sys
+import datetime
+import time
 
 sys.path.append('..')
 
 import snipe.filters
+import snipe.messagelist
 from snipe.filters import *
 
 
@@ -180,9 +183,333 @@ class TestFilters(unittest.TestCase):
 
         self.assertFalse(makefilter('filter foo')(MockMsg()))
 
+    def testParseTable(self):
+        # if this fails, the grammar (or just the code around it) moved;
+        # run "make parsetab"
+        import ply.yacc
+        import snipe._parsetab
+        p = Parser()
+        info = ply.yacc.ParserReflect({k: getattr(p, k) for k in dir(p)})
+        info.get_all()
+        self.assertEqual(info.signature(), snipe._parsetab._lr_signature)
+        # the tables also say where each rule is, for ply's error messages
+        rules = [
+            (prodname + ' -> ' + (' '.join(syms) or '<empty>'), name, line)
+            for (start, _, name, doc) in info.pfuncs
+            for (_, line, prodname, syms)
+            in ply.yacc.parse_grammar(doc, 'filters.py', start)]
+        self.assertEqual(rules, [
+            (rule, func, line)
+            for (rule, _, _, func, _, line)
+            in snipe._parsetab._lr_productions[1:]])
+
+    def testCompile(self):
+        msgs = [
+            MockMsg(foo='bar', bar='bar', baz=1),
+            MockMsg(foo='Bar', Foo='bar', baz=0),
+            MockMsg(foo='quux', bar='quuux', baz=7),
+            MockMsg(foo=3),
+            MockMsg(),
+            ]
+        for s in [
+                'yes',
+                'no',
+                'foo',
+                'not foo',
+                'foo = "bar"',
+                'foo == "bar"',
+                'foo != "bar"',
+                'foo = bar',
+                'foo = /b.*/',
+                'foo == /b.*/',
+                'foo != /b.*/',
+                'baz > 0',
+                'baz <= 1',
+                'foo < 3',
+                'foo = "bar" and baz',
+                'foo = "bar" or baz = 7',
+                'foo xor bar xor baz',
+                'not (foo = /q/ or baz >= 7)',
+                'filter foo',
+                ]:
+            f = makefilter(s)
+            c = snipe.filters.compiled(f)
+            self.assertIs(c, snipe.filters.compiled(makefilter(s)))
+            for m in msgs:
+                self.assertEqual(bool(f(m)), c(m), '%s on %s' % (s, m.dict))
+
+        self.assertEqual(
+            snipe.filters.compiled(makefilter('foo = bar')),
+            snipe.filters.compiled(Compare('=', 'foo', Identifier('bar'))))
+
+    @unittest.skipIf(snipe.messagelist.numpy is None, 'needs numpy')
+    def testMask(self):
+        msgs = [
+            MockMsg(foo='bar', bar='bar', baz=1, time=10),
+            MockMsg(foo='Bar', Foo='bar', baz=0, time=11),
+            MockMsg(foo='quux', bar='quuux', baz=7, time=12),
+            MockMsg(foo=3, time=13),
+            MockMsg(time=14),
+            ]
+        # bar isn't one of the columns, so it's asked about message by
+        # message
+        columns = snipe.messagelist.Columns(
+            msgs, [m.time for m in msgs], ('foo', 'Foo', 'baz'))
+        for s in [
+                'yes',
+                'no',
+                'foo',
+                'not foo',
+                'foo = "bar"',
+                'foo == "bar"',
+                'foo != "bar"',
+                'foo = bar',
+                'foo = /b.*/',
+                'foo != /b.*/',
+                'bar = /q.*/',
+                'baz > 0',
+                'foo < 3',
+                'foo = "bar" and baz',
+                'foo = "bar" or baz = 7',
+                'bar and baz',
+                'foo xor bar xor baz',
+                'not (foo = /q/ or baz >= 7)',
+                'since 11 and until 13',
+                'time = 12',
+                'time > 11',
+                '$"m.field(\'baz\') > 0"',
+                ]:
+            f = makefilter(s)
+            self.assertEqual(
+                list(f.mask(columns, columns.rows())),
+                [bool(f(m)) for m in msgs], s)
+        self.assertTrue(makefilter('foo = /b.*/ and baz').vectorized(columns))
+        self.assertFalse(makefilter('foo and bar').vectorized(columns))
+
+        # a field that hasn't been encoded yet isn't for just a few rows
+        columns = snipe.messagelist.Columns(
+            msgs, [m.time for m in msgs], ('foo', 'Foo', 'baz'))
+        few = columns.none()
+        few[1] = True
+        self.assertIsNone(columns.where('foo', True, bool, few))
+        f = makefilter('foo = "bar"')
+        self.assertEqual(list(f.mask(columns, few)), list(few))
+        self.assertNotIn(('foo', True), columns._encoded)
+        self.assertIsNotNone(columns.where('foo', True, bool, columns.rows()))
+        self.assertIsNotNone(columns.where('foo', True, bool, few))
+
+    def testOptimize(self):
+        self.assertEqual(
+            makefilter('body = /.*kerberos/ and personal').optimize(),
+            makefilter('personal and body = /.*kerberos/'))
+        self.assertEqual(
+            makefilter(
+                'not (body = /x/ or sender = bar or class = "c") or flag'
+                ).optimize(),
+            makefilter(
+                'flag or not (class = "c" or sender = bar or body = /x/)'))
+        # ties keep their order
+        self.assertEqual(
+            makefilter('b and a').optimize(), makefilter('b and a'))
+        self.assertEqual(
+            snipe.filters.compiled(makefilter('foo = /b.*/ and baz')).source,
+            snipe.filters.compiled(makefilter('baz and foo = /b.*/')).source)
+
+    def testPython(self):
+        f = makefilter('$\'m.field("foo") == "bar"\'')
+        self.assertEqual(f, Python('m.field("foo") == "bar"'))
+        self.assertTrue(f(MockMsg(foo='bar')))
+        self.assertFalse(f(MockMsg(foo='baz')))
+        self.assertTrue(makefilter('$"state is None"')(MockMsg()))
+        self.assertFalse(makefilter('$"m.nonexistent"')(MockMsg()))
+        self.assertRaises(SnipeFilterError, makefilter, '$"1 +"')
+        self.assertRaises(SnipeFilterError, makefilter, 'yes and $"m.)"')
+
+    def testPlan(self):
+        postings = MockIndex({
+            'foo': {'bar': [1, 2, 3], 'baz': [4]},
+            'flag': {0: [5, 6], 1: [7]},
+            })
+        self.assertEqual(makefilter('foo = "bar"').plan(postings), [[1, 2, 3]])
+        self.assertEqual(makefilter('foo = "quux"').plan(postings), [])
+        self.assertIsNone(makefilter('foo == "bar"').plan(postings))
+        self.assertIsNone(makefilter('foo = bar').plan(postings))
+        self.assertIsNone(makefilter('quux = "bar"').plan(postings))
+        self.assertEqual(makefilter('flag').plan(postings), [[7]])
+        self.assertEqual(
+            makefilter('foo = "bar" or foo = "baz"').plan(postings),
+            [[1, 2, 3], [4]])
+        self.assertIsNone(makefilter('foo = "bar" or quux').plan(postings))
+        self.assertEqual(
+            makefilter('quux and foo = "bar" and flag').plan(postings),
+            [[7]])
+        self.assertIsNone(makefilter('quux and not flag').plan(postings))
+
+        postings.words = MockWords()
+        self.assertEqual(
+            makefilter('body = /.*kerberos.*is (down|up)/').plan(postings),
+            [('kerberos', 'is ')])
+        self.assertEqual(
+            makefilter('body = "hi"').plan(postings), [('hi',)])
+        self.assertIsNone(makefilter('body != /.*kerberos/').plan(postings))
+        self.assertIsNone(makefilter('body = /.*/').plan(postings))
+        self.assertIsNone(makefilter('foo = /.*kerberos/').plan(postings))
+
+    def testLiterals(self):
+        self.assertEqual(snipe.filters.literals('.*kerberos'), ['kerberos'])
+        self.assertEqual(snipe.filters.literals('(foo)+ x?'), ['foo', ' '])
+        self.assertEqual(snipe.filters.literals('(foo)* x'), [' x'])
+        self.assertEqual(snipe.filters.literals('a|b'), [])
+        self.assertEqual(snipe.filters.literals('('), [])
+        self.assertEqual(snipe.filters.literals('(?i)foo'), [])
+        self.assertEqual(snipe.filters.literals('(?i:foo)bar'), ['bar'])
+
+    def testPrescreen(self):
+        self.assertEqual(snipe.filters.substring('.*kerberos'), 'kerberos')
+        self.assertEqual(snipe.filters.substring('.*kerberos.*'), 'kerberos')
+        self.assertIsNone(snipe.filters.substring('kerberos'))
+        self.assertIsNone(snipe.filters.substring('.*ker+beros'))
+        self.assertEqual(
+            snipe.filters.prescreen('.*(?:kerberos|afs) is down'),
+            [[' is down']])
+        self.assertEqual(
+            snipe.filters.prescreen('.*foo|.*ba+r'),
+            [['foo'], ['b', 'a', 'r']])
+        self.assertIsNone(snipe.filters.prescreen('.*foo|.*'))
+        self.assertIsNone(snipe.filters.prescreen('foo.*bar'))
+
+        for s in ('afs is down', 'kerberos is down', 'afs is up', ''):
+            self.assertEqual(
+                bool(makefilter('body = /.*(kerberos|afs) is down/')(
+                    MockMsg(body=s))),
+                snipe.filters.compiled(
+                    makefilter('body = /.*(kerberos|afs) is down/'))(
+                        MockMsg(body=s)))
+
+    def testCombine(self):
+        self.assertEqual(
+            makefilter('body = /.*foo/ or body = /.*bar/').optimize(),
+            makefilter('body = /(?:.*foo)|(?:.*bar)/'))
+        self.assertEqual(
+            makefilter('body != /.*foo/ and body != /.*bar/').optimize(),
+            makefilter('body != /(?:.*foo)|(?:.*bar)/'))
+        # groups could be backreferenced, and and-ed matches can't merge
+        self.assertEqual(
+            makefilter('body = /(a)\\1/ or body = /.*bar/').optimize(),
+            makefilter('body = /(a)\\1/ or body = /.*bar/'))
+        self.assertEqual(
+            makefilter('body = /.*foo/ and body = /.*bar/').optimize(),
+            makefilter('body = /.*foo/ and body = /.*bar/'))
+        f = snipe.filters.compiled(
+            makefilter('body = /.*foo/ or x or body = /.*bar/'))
+        self.assertTrue(f(MockMsg(body='a bar')))
+        self.assertFalse(f(MockMsg(body='a baz')))
+
+    def testTimeRange(self):
+        inf = float('inf')
+        self.assertEqual(makefilter('yes').timerange(), (-inf, inf))
+        self.assertEqual(makefilter('since 5').timerange(), (5, inf))
+        self.assertEqual(makefilter('until 5').timerange(), (-inf, 5))
+        self.assertEqual(makefilter('time > 5').timerange(), (5, inf))
+        self.assertEqual(makefilter('time <= 5').timerange(), (-inf, 6))
+        self.assertEqual(makefilter('5 = time').timerange(), (5, 6))
+        self.assertEqual(makefilter('foo > 5').timerange(), (-inf, inf))
+        self.assertEqual(makefilter('not since 5').timerange(), (-inf, inf))
+        self.assertEqual(
+            makefilter('since 5 and foo and until 10').timerange(), (5, 10))
+        self.assertEqual(
+            makefilter('since 5 and (until 10 or time = 20)').timerange(),
+            (5, 21))
+        self.assertEqual(
+            makefilter('until 5 or foo').timerange(), (-inf, inf))
+        self.assertEqual(makefilter('since 5 and no').timerange(), (inf, -inf))
+
+        self.assertEqual(makefilter('since 5'), Since(5))
+        self.assertEqual(str(makefilter('until 5')), 'until 5')
+        for f in [makefilter('since 5'), makefilter('not until 5')]:
+            c = snipe.filters.compiled(f)
+            self.assertFalse(f(MockMsg(time=4)))
+            self.assertFalse(c(MockMsg(time=4)))
+            self.assertTrue(f(MockMsg(time=5)))
+            self.assertTrue(c(MockMsg(time=5)))
+
+    def testCacheable(self):
+        self.assertTrue(makefilter('foo = "bar" and not baz').cacheable())
+        self.assertTrue(makefilter('since 5').cacheable())
+        self.assertFalse(makefilter('foo or not $"time.time()"').cacheable())
+        self.assertFalse(makefilter('since "an hour ago"').cacheable())
+        self.assertTrue(
+            makefilter('since "an hour ago"').simplify({}).cacheable())
+        self.assertFalse(makefilter('filter a').cacheable())
+
+    def testParseTime(self):
+        today = datetime.date.today()
+        midnight = time.mktime(today.timetuple())
+        self.assertEqual(snipe.filters.parsetime('today', -1), midnight)
+        self.assertEqual(Since('today').time(), midnight)
+        self.assertEqual(
+            snipe.filters.parsetime('yesterday', -1),
+            time.mktime((today - datetime.timedelta(days=1)).timetuple()))
+
+        for offset in range(7):
+            day = today - datetime.timedelta(days=offset)
+            for name in (day.strftime('%A'), day.strftime('%a').lower()):
+                self.assertEqual(
+                    snipe.filters.parsetime(name, -1),
+                    time.mktime(day.timetuple()))
+
+        # times of day are left alone
+        self.assertEqual(
+            time.localtime(snipe.filters.parsetime('today 3pm', -1))[3:5],
+            (15, 0))
+        self.assertRaises(ValueError, lambda: Since('xyzzy'))
+
+    def testFilterLookup(self):
+        m = MockMsg(foo='bar', baz=1)
+        m.conf_generation = 0
+        m.conf = {'filter': {
+            'a': 'foo = "bar"',
+            'b': 'filter a and baz',
+            'c': 'filter a and filter a',
+            'loop': 'filter loop or baz',
+            'broken': 'foo = ',
+            }}
+
+        self.assertTrue(makefilter('filter a')(m))
+        self.assertTrue(makefilter('filter b')(m))
+        self.assertTrue(makefilter('filter c')(m))
+        self.assertTrue(makefilter('filter loop')(m))
+        self.assertFalse(makefilter('filter broken')(m))
+        self.assertFalse(makefilter('filter nonexistent')(m))
+        self.assertTrue(snipe.filters.compiled(makefilter('filter b'))(m))
+
+        self.assertEqual(
+            makefilter('filter b and yes').simplify({'context': m}),
+            And(Compare('=', 'foo', 'bar'), Truth('baz')))
+
+        # stale until the configuration generation changes
+        m.conf['filter']['a'] = 'foo = "baz"'
+        self.assertTrue(makefilter('filter b')(m))
+        m.conf_generation += 1
+        self.assertFalse(makefilter('filter b')(m))
+
+class MockIndex:
+    def __init__(self, postings):
+        self.postings = postings
+        self.words = None
+
+
+class MockWords:
+    field = 'body'
+
+    def search(self, strings):
+        return tuple(strings)
+
+
 class MockMsg:
     def __init__(self, **kw):
         self.dict = kw
+        self.time = kw.get('time', 0)
         self.backend = self
         self.context = self
         self.conf = {}
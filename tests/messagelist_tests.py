@@ -0,0 +1,406 @@
+# -*- encoding: utf-8 -*-
+# Copyright © 2014 Karl Ramm
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+# CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS
+# BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+
+'''
+Unit tests for the MessageList object
+'''
+
+import sys
+import unittest
+import random
+import itertools
+import datetime
+
+sys.path.append('..')
+import snipe.messagelist
+
+
+class TestMessageList(unittest.TestCase):
+    def testAppend(self):
+        l = snipe.messagelist.MessageList()
+        for t in [1, 2, 4, 3, 0]:
+            l.append(MockMsg(t))
+        self.assertEqual([m.time for m in l], [0, 1, 2, 3, 4])
+        self.assertEqual(list(l.times), [0, 1, 2, 3, 4])
+        self.assertEqual(len(l), 5)
+        self.assertEqual(l[-1].time, 4)
+
+    def testLocate(self):
+        l = snipe.messagelist.MessageList(MockMsg(t) for t in [1, 2, 2, 3])
+        self.assertEqual(l.locate(0), 0)
+        self.assertEqual(l.locate(2), 1)
+        self.assertEqual(l.locate(2, True), 3)
+        self.assertEqual(l.locate(2.5), 3)
+        self.assertEqual(l.locate(float('inf')), 4)
+        self.assertEqual(l.locate(l[3]), 3)
+
+    def testIndex(self):
+        ms = [MockMsg(t) for t in [1, 2, 2, 2, 3]]
+        l = snipe.messagelist.MessageList(ms)
+        self.assertEqual(l.index(ms[3]), 3)
+        self.assertEqual(l.index(ms[2], 1, 4), 2)
+        self.assertEqual(l.index(MockMsg(2)), 1)
+        self.assertEqual(l.index(2.0), 1)
+        self.assertRaises(ValueError, lambda: l.index(MockMsg(2.5)))
+
+    def testPrependMerge(self):
+        l = snipe.messagelist.MessageList(MockMsg(t) for t in [10, 11])
+        l.prepend([MockMsg(t) for t in [5, 6]])
+        self.assertEqual([m.time for m in l], [5, 6, 10, 11])
+        l.prepend([MockMsg(t) for t in [1, 7]]) # not actually older
+        self.assertEqual([m.time for m in l], [1, 5, 6, 7, 10, 11])
+        l.merge([MockMsg(t) for t in [0, 8, 12]])
+        self.assertEqual([m.time for m in l], [0, 1, 5, 6, 7, 8, 10, 11, 12])
+        self.assertEqual(list(l.times), [m.time for m in l])
+
+        times = [random.random() for i in range(200)]
+        l = snipe.messagelist.MessageList()
+        for i in range(0, 200, 20):
+            l.merge(sorted(MockMsg(t) for t in times[i:i + 20]))
+        self.assertEqual([m.time for m in l], sorted(times))
+        self.assertEqual(list(l.times), sorted(times))
+
+    def testRevalidate(self):
+        l = snipe.messagelist.MessageList(MockMsg(t) for t in range(10, 20))
+        gen = l.generation
+        self.assertEqual(l.revalidate(gen, 2, 5, True), (2, 5))
+
+        l.append(MockMsg(30))
+        # appending past where a forward walk stopped changes nothing
+        self.assertEqual(l.revalidate(gen, 2, 5, True), (2, 5))
+        # but a walk backwards from the end needs to start over
+        self.assertIsNone(l.revalidate(gen, 9, 5, False))
+
+        l.prepend([MockMsg(1), MockMsg(2)])
+        self.assertEqual(l.revalidate(gen, 2, 5, True), (4, 7))
+        self.assertEqual(l.revalidate(gen, 5, 2, False), (7, 4))
+        # a forward walk from the beginning needs to start over
+        self.assertIsNone(l.revalidate(gen, 0, 5, True))
+
+        gen = l.generation
+        l.insert(MockMsg(15.5))
+        self.assertIsNone(l.revalidate(gen, 4, 9, True))
+        self.assertEqual(l.revalidate(gen, 4, 6, True), (4, 6))
+        self.assertEqual(l.revalidate(gen, 12, 10, False), (13, 11))
+
+        for i in range(l.CHANGELOG + 1):
+            l.append(MockMsg(100 + i))
+        self.assertIsNone(l.revalidate(gen, 4, 6, True))
+
+    def testBlocks(self):
+        random.seed(4)
+        l = SmallMessageList()
+        model = []
+        for i in range(300):
+            op = random.choice(['append', 'insert', 'prepend', 'merge'])
+            if op == 'append' or op == 'insert':
+                ms = [MockMsg(random.random())]
+                getattr(l, op)(ms[0])
+            else:
+                ms = sorted(MockMsg(random.random()) for j in range(7))
+                if op == 'prepend' and l:
+                    ms = [MockMsg(m.time * l[0].time) for m in ms]
+                getattr(l, op)(ms)
+            model = sorted(model + ms)
+        self.assertEqual(len(l), len(model))
+        self.assertEqual([m.time for m in l], [m.time for m in model])
+        self.assertEqual(list(l.times), [m.time for m in model])
+        self.assertEqual(
+            [l[i].time for i in range(-len(l), len(l))],
+            [m.time for m in model + model])
+        self.assertEqual(
+            [m.time for m in reversed(l)], [m.time for m in reversed(model)])
+        self.assertEqual(
+            [i for (i, m) in l.iterate(17)], list(range(17, len(l))))
+        self.assertEqual(
+            [m.time for (i, m) in l.iterate(17, False)],
+            [m.time for m in reversed(model[:18])])
+        for m in model[::5]:
+            self.assertEqual(l.locate(m), model.index(m))
+            self.assertEqual(l.locate(m, True), model.index(m) + 1)
+            self.assertEqual(l.index(m), model.index(m))
+        self.assertEqual(l.locate(-1), 0)
+        self.assertEqual(l.locate(2), len(l))
+
+    def testSeek(self):
+        ms = [MockMsg(t) for t in [1, 2, 2, 3]]
+        l = snipe.messagelist.MessageList(ms)
+        self.assertEqual(l.seek(None), 0)
+        self.assertEqual(l.seek(None, False), 3)
+        self.assertEqual(l.seek(ms[2]), 2)
+        self.assertEqual(l.seek(ms[2], False), 2)
+        self.assertEqual(l.seek(2.5), 3)
+        self.assertEqual(l.seek(2.5, False), 2)
+        self.assertEqual(l.seek(0, False), -1)
+
+    def testTies(self):
+        # lots of messages at the same time, told apart by seq
+        random.seed(15)
+        ms = [MockMsg(i // 10, seq=i) for i in range(100)]
+        l = SmallMessageList()
+        shuffled = list(ms)
+        random.shuffle(shuffled)
+        while shuffled:
+            op = random.choice(['append', 'insert', 'prepend', 'merge'])
+            chunk = sorted(shuffled[:random.randrange(1, 7)])
+            shuffled = shuffled[len(chunk):]
+            if op == 'append' or op == 'insert':
+                for m in chunk:
+                    getattr(l, op)(m)
+            else:
+                getattr(l, op)(chunk)
+        self.assertEqual([m.seq for m in l], list(range(100)))
+        for i, m in enumerate(ms):
+            self.assertEqual(l.index(m), i)
+            self.assertEqual(l.seek(m), i)
+            self.assertEqual(l.seek(m, False), i)
+        # somewhere in the middle of a run of ties, but not in the list
+        self.assertEqual(l.span(MockMsg(5, seq=54.5)), (55, 55))
+        self.assertEqual(l.seek(MockMsg(5, seq=54.5)), 55)
+        self.assertEqual(l.seek(MockMsg(5, seq=54.5), False), 54)
+        self.assertEqual(l.span(5), (50, 60))
+
+    def testSlices(self):
+        ms = [MockMsg(t) for t in range(20)]
+        l = SmallMessageList(ms)
+        for size in (None, 1, 3, 100):
+            for point in (0, 7, 19):
+                for forward in (True, False):
+                    got = []
+                    for start, chunk in l.slices(point, forward, size):
+                        self.assertIs(chunk[0], l[start])
+                        if size is not None:
+                            self.assertLessEqual(len(chunk), size)
+                        got.extend(chunk)
+                    self.assertEqual(
+                        got, [m for (_, m) in l.iterate(point, forward)])
+        self.assertEqual(list(l.slices(20)), [])
+        self.assertEqual(list(l.slices(-1, False)), [])
+
+    def testSift(self):
+        l = SmallMessageList(MockMsg(t) for t in range(20))
+        asked = []
+
+        def even(m):
+            asked.append(m.time)
+            return m.time % 2 == 0
+
+        for forward in (True, False):
+            got = []
+            for start, chunk, flags in l.sift(7, forward, even, 'even', 3):
+                self.assertIs(chunk[0], l[start])
+                self.assertEqual(len(flags), len(chunk))
+                got.extend(m.time for (m, f) in zip(chunk, flags) if f)
+            expected = range(7, 20) if forward else range(7, -1, -1)
+            self.assertEqual(got, [t for t in expected if t % 2 == 0])
+        self.assertEqual(sorted(asked), list(range(20)))
+
+        # asking again only asks about new messages
+        del asked[:]
+        l.append(MockMsg(20))
+        l.insert(MockMsg(4.5))
+        l.prepend([MockMsg(-2)])
+        l.merge([MockMsg(6.5), MockMsg(8)])
+        got = [
+            m.time for (_, chunk, flags) in l.sift(0, True, even, 'even')
+            for (m, f) in zip(chunk, flags) if f]
+        self.assertEqual(got, [-2, 0, 2, 4, 6, 8, 8, 10, 12, 14, 16, 18, 20])
+        self.assertEqual(sorted(asked), [-2, 4.5, 6.5, 8, 20])
+
+        l.discard(5)
+        del asked[:]
+        self.assertEqual(
+            sum(sum(flags) for (_, _, flags) in l.sift(0, True, even, 'even')),
+            10)
+        self.assertEqual(asked, [])
+
+    def testPostings(self):
+        random.seed(5)
+        l = SmallMessageList(indexed=('color',))
+        model = []
+        for i in range(200):
+            op = random.choice(['append', 'insert', 'prepend', 'merge'])
+            ms = sorted(
+                MockMsg(random.random(), color=random.choice('rgb'))
+                for j in range(random.randrange(1, 7)))
+            if op == 'append' or op == 'insert':
+                for m in ms:
+                    getattr(l, op)(m)
+            else:
+                getattr(l, op)(ms)
+            model = sorted(model + ms)
+        self.assertEqual(sorted(l.postings['color']), ['b', 'g', 'r'])
+        for color, postings in l.postings['color'].items():
+            self.assertEqual(
+                [id(m) for m in postings],
+                [id(m) for m in model if m.color == color])
+
+    def testDiscard(self):
+        ms = [
+            MockMsg(
+                i * 3600, color='rgb'[i % 3], keep=(i % 10 == 0),
+                body='message %d' % (i,))
+            for i in range(100)]
+        l = SmallMessageList(ms, indexed=('color',), words=True, days=True)
+        self.assertEqual(l.discard(0), [])
+        dropped = l.discard(50, lambda m: m.keep)
+        self.assertEqual(
+            [id(m) for m in dropped],
+            [id(m) for m in ms[:50] if not m.keep])
+        model = [m for m in ms if m.keep or m not in dropped]
+        self.assertEqual([id(m) for m in l], [id(m) for m in model])
+        self.assertEqual(l.seek(ms[60]), 15)
+        self.assertEqual(l.index(ms[20]), 2)
+        for color, postings in l.postings['color'].items():
+            self.assertEqual(
+                [id(m) for m in postings],
+                [id(m) for m in model if m.color == color])
+        self.assertEqual(sum(l.days.values()), len(model))
+        self.assertEqual(
+            [m.time for m in l.words.search(['message 3'])], [30 * 3600])
+        self.assertEqual(
+            [m.time for m in l.words.search(['message 7'])],
+            [i * 3600 for i in range(70, 80)])
+        self.assertNotIn('7', l.words.words)
+
+        self.assertEqual(len(l.discard(1000)), len(model))
+        self.assertEqual(len(l), 0)
+        self.assertEqual(l.postings['color'], {})
+        self.assertEqual(l.days, {})
+        l.append(ms[0])
+        self.assertEqual(list(l), [ms[0]])
+
+
+class TestDays(unittest.TestCase):
+    def testDays(self):
+        def when(day, hour):
+            return snipe.messagelist.midnight(
+                datetime.date(2015, 6, day)) + hour * 3600
+
+        l = snipe.messagelist.MessageList(
+            (MockMsg(when(day, hour)) for (day, hour) in [
+                (1, 1), (1, 23), (3, 12), (4, 0), (4, 5), (4, 18)]),
+            days=True)
+        l.prepend([MockMsg(when(1, 0))])
+        l.merge([MockMsg(when(3, 13))])
+        l.append(MockMsg(float('inf')))
+
+        self.assertEqual(l.day(datetime.date(2015, 6, 1)), (3, 0, 2))
+        self.assertEqual(l.day(datetime.date(2015, 6, 2)), (0, None, None))
+        self.assertEqual(l.day(datetime.date(2015, 6, 3)), (2, 3, 4))
+        self.assertEqual(l.day(datetime.date(2015, 6, 4)), (3, 5, 7))
+
+        self.assertEqual(
+            l.nextdate(datetime.date(2015, 6, 1)), datetime.date(2015, 6, 3))
+        self.assertEqual(
+            l.nextdate(datetime.date(2015, 6, 2)), datetime.date(2015, 6, 3))
+        self.assertEqual(l.nextdate(datetime.date(2015, 6, 4)), None)
+        self.assertEqual(
+            l.nextdate(datetime.date(2015, 6, 3), False),
+            datetime.date(2015, 6, 1))
+        self.assertEqual(l.nextdate(datetime.date(2015, 6, 1), False), None)
+
+        self.assertIsNone(snipe.messagelist.MessageList().days)
+
+
+class TestWordIndex(unittest.TestCase):
+    def testSearch(self):
+        bodies = [
+            'Kerberos is down',
+            'is kerberos down?',
+            'the KDC is down',
+            'lunch?',
+            'kerberized',
+            ]
+        l = snipe.messagelist.MessageList(
+            (MockMsg(t, body=body) for (t, body) in enumerate(bodies)),
+            words=True)
+        words = l.words
+
+        def search(*strings):
+            result = words.search(strings)
+            return None if result is None else [m.body for m in result]
+
+        def candidates(string):
+            return sorted(
+                m.body for m in itertools.chain.from_iterable(
+                    words.candidates(string)))
+
+        self.assertEqual(
+            candidates('s dow'),
+            ['Kerberos is down', 'is kerberos down?', 'the KDC is down'])
+        self.assertEqual(
+            candidates('erber'),
+            ['Kerberos is down', 'is kerberos down?', 'kerberized'])
+        self.assertEqual(
+            candidates('lunch is'), ['lunch?'])
+        self.assertIsNone(words.candidates('?'))
+
+        self.assertEqual(search('kerberos is'), ['Kerberos is down'])
+        self.assertEqual(search('s down', 'KDC'), ['the KDC is down'])
+        self.assertEqual(search('?'), None)
+        self.assertEqual(search('?', 'unch'), ['lunch?'])
+
+        # remembered searches are kept up to date
+        l.append(MockMsg(10, body='kerberos is up'))
+        l.append(MockMsg(11, body='zephyr is down'))
+        self.assertEqual(
+            search('kerberos is'), ['Kerberos is down', 'kerberos is up'])
+        self.assertEqual(
+            search('s down', 'KDC'), ['the KDC is down'])
+
+
+class SmallMessageList(snipe.messagelist.MessageList):
+    BLOCKSIZE = 4
+
+
+class MockMsg:
+    seq = 0
+
+    def __init__(self, time, **kw):
+        self.time = time
+        self.__dict__.update(kw)
+
+    def field(self, name, canon=True):
+        return getattr(self, name, '')
+
+    def __float__(self):
+        return float(self.time)
+
+    def __lt__(self, other):
+        return (self.time, self.seq) < (other.time, other.seq)
+
+    def __repr__(self):
+        return 'MockMsg(%s)' % (repr(self.time),)
+
+
+if __name__ == '__main__':
+    unittest.main()
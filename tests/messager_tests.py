@@ -0,0 +1,127 @@
+# -*- encoding: utf-8 -*-
+# Copyright © 2014 Karl Ramm
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+# CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS
+# BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+
+'''
+Unit tests for the messager window's decoration rules
+'''
+
+import sys
+import unittest
+import logging
+import time
+import unittest.mock
+
+import parsedatetime
+
+sys.path.append('..')
+import snipe.messager
+import snipe.messages
+
+
+class TestRules(unittest.TestCase):
+    def rules(self, conf):
+        rules = snipe.messager.Rules(MockContext(conf))
+        self.logged = []
+        rules.log = logging.getLogger('TestRules')
+        rules.log.addHandler(ListHandler(self.logged))
+        rules.log.propagate = False
+        return rules
+
+    def testEmpty(self):
+        rules = self.rules({})
+        m = snipe.messages.SnipeMessage(None, 'hi')
+        self.assertEqual(rules.decorate(m), {})
+        self.assertEqual(rules.match(m), ())
+        self.assertEqual(self.logged, [])
+
+    def testDecorate(self):
+        rules = self.rules({'rule': [
+            ('body = "hi"', {'foreground': 'red'}),
+            ('yes', {'background': 'blue'}),
+            ('body = "hi"', {'background': 'green'}),
+            ]})
+        hi = snipe.messages.SnipeMessage(None, 'hi')
+        bye = snipe.messages.SnipeMessage(None, 'bye')
+        self.assertEqual(
+            rules.decorate(hi), {'foreground': 'red', 'background': 'green'})
+        self.assertEqual(rules.decorate(bye), {'background': 'blue'})
+        self.assertEqual(self.logged, [])
+
+
+    def testPython(self):
+        rules = self.rules({'rule': [
+            ('$"m.body in shown"', {'foreground': 'red'}),
+            ]})
+        m = snipe.messages.SnipeMessage(None, 'hi')
+        shown = set()
+        rules.load()
+        rules.rules[0][0].function.__globals__['shown'] = shown
+        self.assertEqual(rules.decorate(m), {})
+        shown.add('hi')
+        self.assertEqual(rules.decorate(m), {'foreground': 'red'})
+
+
+    def testRelativeTime(self):
+        rules = self.rules({'rule': [
+            ('since "10 minutes ago"', {'foreground': 'red'}),
+            ]})
+        now = [time.time()]
+        parse = parsedatetime.Calendar.parse
+
+        def fakeparse(self, s, sourceTime=None, *args, **kw):
+            return parse(self, s, time.localtime(now[0]), *args, **kw)
+
+        m = snipe.messages.SnipeMessage(None, 'hi', now[0] - 300)
+        with unittest.mock.patch.object(
+                parsedatetime.Calendar, 'parse', fakeparse), \
+                unittest.mock.patch('time.time', lambda: now[0]):
+            self.assertEqual(rules.decorate(m), {'foreground': 'red'})
+            now[0] += 600
+            self.assertEqual(rules.decorate(m), {})
+
+
+class ListHandler(logging.Handler):
+    def __init__(self, records):
+        super().__init__()
+        self.records = records
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class MockContext:
+    def __init__(self, conf):
+        self.conf = conf
+        self.conf_generation = 0
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,243 @@
+# -*- encoding: utf-8 -*-
+# Copyright © 2014 Karl Ramm
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+# CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS
+# BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+
+'''
+Unit tests for message backends
+'''
+
+import sys
+import unittest
+import datetime
+
+sys.path.append('..')
+import snipe.filters
+import snipe.messagelist
+import snipe.messages
+
+
+class TestEvict(unittest.TestCase):
+    def backend(self, retain_filter, conf={}):
+        backend = MockBackend(MockContext(conf))
+        backend.retain_filter = retain_filter
+        backend.messages = snipe.messagelist.MessageList(
+            snipe.messages.SnipeMessage(backend, str(i), i) for i in range(20))
+        return backend
+
+    def testEvict(self):
+        backend = self.backend(None)
+        self.assertEqual(len(backend.evict()), 10)
+        self.assertEqual(len(backend.messages), 10)
+        self.assertEqual(backend.horizon.time, 10)
+
+    def testRetainEverything(self):
+        for retain in ('yes', 'backend = "mock"'):
+            backend = self.backend(retain)
+            self.assertEqual(backend.evict(), [])
+            self.assertEqual(len(backend.messages), 20)
+
+    def testRetainUndefined(self):
+        backend = self.backend('filter nosuch')
+        self.assertEqual(len(backend.evict()), 10)
+        self.assertEqual(len(backend.messages), 10)
+
+    def testRetainNothing(self):
+        backend = self.backend('no')
+        self.assertEqual(len(backend.evict()), 10)
+        self.assertEqual(len(backend.messages), 10)
+
+
+class TestNextDate(unittest.TestCase):
+    def testHorizon(self):
+        def when(day, hour=12):
+            return snipe.messagelist.midnight(
+                datetime.date(2015, 6, day)) + hour * 3600
+
+        backend = MockBackend(MockContext({}))
+        backend.retain = 2
+        backend.retain_filter = 'body = "personal"'
+        backend.messages = snipe.messagelist.MessageList(
+            (snipe.messages.SnipeMessage(backend, body, when(day))
+             for (day, body) in [
+                (1, 'personal'), (2, ''), (3, 'personal'), (4, ''), (5, ''),
+                (6, '')]),
+            days=True)
+
+        self.assertEqual(
+            backend.nextdate(datetime.date(2015, 6, 5), False),
+            datetime.date(2015, 6, 4))
+        self.assertEqual(len(backend.evict()), 2)
+        self.assertEqual(backend.horizon.time, when(5))
+
+        # the personals are still there, but their days don't count
+        self.assertEqual(
+            backend.messages.nextdate(datetime.date(2015, 6, 5), False),
+            datetime.date(2015, 6, 3))
+        self.assertIsNone(backend.nextdate(datetime.date(2015, 6, 5), False))
+        self.assertEqual(
+            backend.nextdate(datetime.date(2015, 6, 6), False),
+            datetime.date(2015, 6, 5))
+        self.assertEqual(
+            backend.nextdate(datetime.date(2015, 5, 30)),
+            datetime.date(2015, 6, 5))
+        self.assertEqual(
+            backend.nextdate(datetime.date(2015, 6, 5)),
+            datetime.date(2015, 6, 6))
+        self.assertIsNone(backend.nextdate(datetime.date(2015, 6, 6)))
+
+        self.assertIsNone(
+            MockBackend(MockContext({})).nextdate(datetime.date(2015, 6, 5)))
+
+    def testHeader(self):
+        context = MockContext({})
+        aggregator = snipe.messages.AggregatorBackend(
+            context, [snipe.messages.DateBackend(context)])
+        date = datetime.date(2015, 6, 5)
+        when = snipe.messagelist.midnight(date)
+
+        # not until it's been backfilled to
+        self.assertIsNone(aggregator.dateheader(date))
+        aggregator.backfill(None, when)
+        header = aggregator.dateheader(date)
+        self.assertEqual(header.time, when)
+        # it's the one a walk would find
+        self.assertIs(next(aggregator.walk(when, True)), header)
+        self.assertIs(aggregator.dateheader(date), header)
+
+        self.assertIsNone(aggregator.dateheader(
+            datetime.date.today() + datetime.timedelta(days=1)))
+
+
+class TestWalk(unittest.TestCase):
+    def testBulk(self):
+        backend = MockBackend(MockContext({}))
+        backend.messages = snipe.messagelist.MessageList(
+            (snipe.messages.SnipeMessage(backend, str(i % 3), i)
+             for i in range(1000)),
+            indexed=('body',))
+        # the posting lists can't help with this one
+        mfilter = snipe.filters.makefilter('not body = "0" and time >= 100')
+        self.assertIsNone(mfilter.plan(backend.messages))
+        batch = next(backend.walk_batches(None, True, mfilter, size=10))
+        self.assertEqual(
+            [m.time for m in batch], [t for t in range(100, 110) if t % 3])
+        # the display only asks about what it needs to
+        flags, = backend.messages._flags.values()
+        self.assertIn(snipe.messagelist.UNKNOWN, b''.join(flags))
+
+        backend.messages.forget()
+        batch = next(backend.walk_batches(
+            None, True, mfilter, size=10, search=True))
+        self.assertEqual(
+            [m.time for m in batch], [t for t in range(100, 110) if t % 3])
+        if snipe.messagelist.numpy is not None:
+            # the answers for all of them came in at once
+            flags, = backend.messages._flags.values()
+            self.assertNotIn(snipe.messagelist.UNKNOWN, b''.join(flags))
+        self.assertEqual(backend.count(mfilter), 600)
+        self.assertEqual(
+            backend.count(snipe.filters.makefilter('backend = "mock"')), 1000)
+
+        # filters that have to look at each message still go lazily
+        mfilter = snipe.filters.makefilter('noise or body = "1"')
+        batch = next(backend.walk_batches(
+            None, True, mfilter, size=10, search=True))
+        self.assertEqual([m.time for m in batch], [1, 4, 7])
+        flags = backend.messages._flags[mfilter, None]
+        self.assertIn(snipe.messagelist.UNKNOWN, b''.join(flags))
+        self.assertEqual(backend.count(mfilter), 333)
+
+
+    def testPython(self):
+        backend = MockBackend(MockContext({}))
+        backend.messages = snipe.messagelist.MessageList(
+            snipe.messages.SnipeMessage(backend, str(i), i)
+            for i in range(10))
+        mfilter = snipe.filters.makefilter('$"m.time >= state_of_the_world"')
+        for cutoff in (5, 8):
+            mfilter.function.__globals__['state_of_the_world'] = cutoff
+            self.assertEqual(
+                [m.time for m in backend.walk(None, True, mfilter)],
+                list(range(cutoff, 10)))
+            self.assertEqual(
+                [m.time for m in backend.walk(3, True, mfilter)],
+                list(range(cutoff, 10)))
+
+    def testStep(self):
+        asked = []
+
+        def noted(m):
+            asked.append(m.time)
+            return m.time % 10 == 9
+
+        backends = []
+        for name in ('one', 'two'):
+            backend = MockBackend(MockContext({}))
+            backend.name = name
+            backend.messages = snipe.messagelist.MessageList(
+                snipe.messages.SnipeMessage(backend, name, i)
+                for i in range(1000))
+            backends.append(backend)
+        mfilter = snipe.filters.makefilter('$"noted(m)"')
+        mfilter.function.__globals__['noted'] = noted
+
+        # getting the next match only looks a little past it
+        m = next(backends[0].walk(0, True, mfilter))
+        self.assertEqual(m.time, 9)
+        self.assertLess(len(asked), 2 * 10)
+
+        del asked[:]
+        aggregator = snipe.messages.AggregatorBackend(
+            MockContext({}), backends)
+        m = next(aggregator.walk(150, True, mfilter))
+        self.assertEqual(m.time, 159)
+        self.assertLess(len(asked), 2 * 2 * 10)
+
+        # but the whole walk is the same either way
+        self.assertEqual(
+            [m.time for m in aggregator.walk(150, False, mfilter)],
+            [m.time for b in aggregator.walk_batches(150, False, mfilter)
+             for m in b])
+
+
+class MockBackend(snipe.messages.SnipeBackend):
+    name = 'mock'
+    retain = 10
+    EVICT = 1
+    EVICT_GRACE = 0
+
+
+class MockContext:
+    def __init__(self, conf):
+        self.conf = conf
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+# -*- encoding: utf-8 -*-
+# Copyright © 2014 Karl Ramm
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+# notice, this list of conditions and the following disclaimer.
+#
+# 2. Redistributions in binary form must reproduce the above
+# copyright notice, this list of conditions and the following
+# disclaimer in the documentation and/or other materials provided
+# with the distribution.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND
+# CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES,
+# INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF
+# MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS
+# BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+# EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+# TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON
+# ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR
+# TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF
+# THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF
+# SUCH DAMAGE.
+
+
+'''
+Unit tests for the on-disk message store
+'''
+
+import sys
+import unittest
+import os
+import stat
+import tempfile
+
+sys.path.append('..')
+import snipe._store
+
+
+class TestMessageStore(unittest.TestCase):
+    def testPermissions(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'roost.db')
+            umask = os.umask(0o022)
+            try:
+                store = snipe._store.MessageStore(path)
+                store.add([('1', 1.0, 1, {'message': 'hi'})])
+            finally:
+                os.umask(umask)
+            names = [
+                name for name in os.listdir(directory)
+                if name.startswith('roost.db')]
+            self.assertIn('roost.db-wal', names)
+            for name in names:
+                mode = os.stat(os.path.join(directory, name)).st_mode
+                self.assertEqual(stat.S_IMODE(mode), 0o600, name)
+            store.close()
+
+            # and files left looser by an older snipe get tightened up
+            os.chmod(path, 0o644)
+            snipe._store.MessageStore(path).close()
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o600)
+
+
+if __name__ == '__main__':
+    unittest.main()